@@ -1,17 +1,26 @@
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 from api.dependencies.auth import get_current_active_user
 from api.errors import raise_http_exception
-from shared.queue.queue import q
+from api.service.progress import ProgressStream
+from settings import settings
+from shared.queue.reliable import ReliableQueue
+from shared.queue.cost import TaskCost
 from shared.schemas.videos import VideoSchema, NewVideo, UpdateVideoAPI
 from shared.schemas.measurements import (MeasurementSchema,
                                          NewMeasurement,
                                          UpdateMeasurementAPI)
+from shared.schemas.clips import ClipSchema, NewClip, UpdateClip
 from shared.schemas.users import UserSchema
 from shared.service.videos import VideoManager
 
 
 router = APIRouter(prefix='/api/v1/videos')
 video_manager = VideoManager()
+video_queue = ReliableQueue('VIDEO')
+measurement_queue = ReliableQueue('MEASUREMENTS')
+clip_queue = ReliableQueue('CLIPS')
+task_cost = TaskCost()
 
 
 @router.post('/', response_model=VideoSchema)
@@ -39,6 +48,16 @@ def get_video(id: int,
     return video_manager.get_video(video_id=id)
 
 
+@router.get('/{id}/progress/')
+def stream_video_progress(id: int,
+                          current_user: UserSchema =
+                          Depends(get_current_active_user)) -> StreamingResponse:
+    video = video_manager.get_video(video_id=id)
+    stream = ProgressStream('video', id, video.status)
+    return StreamingResponse(stream.events(),
+                             media_type='text/event-stream')
+
+
 @router.patch('/{id}/', response_model=VideoSchema)
 def modify_video(id: int,
                 params: UpdateVideoAPI,
@@ -53,9 +72,10 @@ def modify_video(id: int,
                  current_user: UserSchema =
                 Depends(get_current_active_user)) -> VideoSchema:
     params = UpdateVideoAPI(status='QUEUED')
-    q.lpush('VIDEO_TODO', id)
-    return video_manager.update_video(video_id=id,
-                                      params=params)
+    video = video_manager.update_video(video_id=id,
+                                       params=params)
+    video_queue.push(id, task_cost.get_video_delay(video, video_manager.s3))
+    return video
 
 
 @router.delete('/{id}/', response_model=VideoSchema)
@@ -78,7 +98,9 @@ def create_measurement(video_id: int,
     
     measurement = video_manager.create_measurement(video_id=video_id,
                                                    measurement=measurement)
-    if requires_queuing: q.lpush('MEASUREMENTS_TODO', measurement.id)
+    if requires_queuing:
+        delay = task_cost.get_measurement_delay(measurement, video)
+        measurement_queue.push(measurement.id, delay)
     return measurement
 
 
@@ -94,6 +116,19 @@ def get_video(video_id: int,
     raise_http_exception(404, f'Measurement not found for video {video_id}')
 
 
+@router.get('/{video_id}/measurements/{id}/progress/')
+def stream_measurement_progress(video_id: int,
+                                id: int,
+                                current_user: UserSchema =
+                                Depends(get_current_active_user)) -> StreamingResponse:
+    measurement = video_manager.get_measurement(measurement_id=id)
+    if measurement.video_id == video_id:
+        stream = ProgressStream('measurement', id, measurement.status)
+        return StreamingResponse(stream.events(),
+                                 media_type='text/event-stream')
+    raise_http_exception(404, f'Measurement not found for video {video_id}')
+
+
 @router.patch('/{video_id}/measurements/{id}/',
               response_model=MeasurementSchema)
 def modify_video(video_id: int,
@@ -118,3 +153,71 @@ def deactivate_video(video_id: int,
     if measurement.video_id == video_id:
         return video_manager.remove_measurement(measurement_id=id)
     raise_http_exception(404, f'Measurement not found for video {video_id}')
+
+
+@router.post('/{video_id}/measurements/{id}/clips/',
+             response_model=ClipSchema)
+def create_clip(video_id: int,
+                id: int,
+                clip: NewClip,
+                current_user: UserSchema =
+                Depends(get_current_active_user)) -> ClipSchema:
+    measurement = video_manager.get_measurement(measurement_id=id)
+    if measurement.video_id != video_id:
+        raise_http_exception(404, f'Measurement not found for video {video_id}')
+    video = video_manager.get_video(video_id)
+    if video.status != 'OPTIMIZED':
+        raise_http_exception(409, 'Clips require an optimized video')
+    clip.start_time = round(clip.start_time, 2)
+    clip.end_time = round(clip.end_time, 2)
+    duration = clip.end_time - clip.start_time
+    if clip.start_time < 0 or duration <= 0:
+        raise_http_exception(422, 'Clip end time should follow its start time')
+    if duration > settings.CLIP_MAX_DURATION:
+        raise_http_exception(422, 'Clips are limited to '
+                             f'{settings.CLIP_MAX_DURATION} seconds')
+
+    # Rendered clips are cached per time range, failed ones are retried
+    cached = video_manager.get_measurement_clip(measurement_id=id,
+                                                start_time=clip.start_time,
+                                                end_time=clip.end_time)
+    if cached and cached.status != 'ERROR':
+        return cached
+    if cached:
+        clip = video_manager.update_clip(clip_id=cached.id,
+                                         params=UpdateClip(status='QUEUED'))
+    else:
+        clip = video_manager.create_clip(measurement_id=id, clip=clip)
+    clip_queue.push(clip.id)
+    return clip
+
+
+@router.get('/{video_id}/measurements/{measurement_id}/clips/{id}/',
+            response_model=ClipSchema)
+def get_clip(video_id: int,
+             measurement_id: int,
+             id: int,
+             current_user: UserSchema =
+             Depends(get_current_active_user)) -> ClipSchema:
+    measurement = video_manager.get_measurement(measurement_id=measurement_id)
+    clip = video_manager.get_clip(clip_id=id)
+    if measurement.video_id == video_id and clip \
+            and clip.measurement_id == measurement_id:
+        return clip
+    raise_http_exception(404, f'Clip not found for measurement {measurement_id}')
+
+
+@router.get('/{video_id}/measurements/{measurement_id}/clips/{id}/progress/')
+def stream_clip_progress(video_id: int,
+                         measurement_id: int,
+                         id: int,
+                         current_user: UserSchema =
+                         Depends(get_current_active_user)) -> StreamingResponse:
+    measurement = video_manager.get_measurement(measurement_id=measurement_id)
+    clip = video_manager.get_clip(clip_id=id)
+    if measurement.video_id == video_id and clip \
+            and clip.measurement_id == measurement_id:
+        stream = ProgressStream('clip', id, clip.status)
+        return StreamingResponse(stream.events(),
+                                 media_type='text/event-stream')
+    raise_http_exception(404, f'Clip not found for measurement {measurement_id}')
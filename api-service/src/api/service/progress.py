@@ -0,0 +1,67 @@
+import json
+from redis import asyncio as aioredis
+from settings import settings
+from shared.queue.progress import (TERMINAL_STATUSES,
+                                   get_progress_channel,
+                                   get_progress_key)
+
+
+class ProgressStream:
+    '''Relays the progress messages workers publish for a video or a
+    measurement as server-sent events, until a terminal status'''
+
+    KEEPALIVE = 15
+
+    def __init__(self, kind: str, item_id: int, status: str = None) -> None:
+        self.kind = kind
+        self.item_id = item_id
+        # Status from the database, used when no progress is stored anymore
+        self.status = status
+        self.channel = get_progress_channel(kind, item_id)
+        self.key = get_progress_key(kind, item_id)
+
+    def get_client(self):
+        return aioredis.Redis(host=settings.REDIS_HOST,
+                              port=settings.REDIS_PORT,
+                              password=settings.REDIS_PASSWORD)
+
+    def format_event(self, data: str):
+        return f'event: progress\ndata: {data}\n\n'
+
+    def is_terminal(self, data: str):
+        return json.loads(data).get('status') in TERMINAL_STATUSES
+
+    def get_initial_message(self, last: bytes | None):
+        if last:
+            return last.decode()
+        if self.status:
+            return json.dumps({'kind': self.kind,
+                               'id': self.item_id,
+                               'status': self.status})
+
+    async def events(self):
+        client = self.get_client()
+        pubsub = client.pubsub()
+        try:
+            # Subscribe before reading the last message so none is missed
+            await pubsub.subscribe(self.channel)
+            initial = self.get_initial_message(await client.get(self.key))
+            if initial:
+                yield self.format_event(initial)
+                if self.is_terminal(initial):
+                    return
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=self.KEEPALIVE)
+                if message is None:
+                    yield ': keepalive\n\n'
+                    continue
+                data = message['data'].decode()
+                yield self.format_event(data)
+                if self.is_terminal(data):
+                    return
+        finally:
+            await pubsub.unsubscribe(self.channel)
+            await pubsub.close()
+            await client.close()
@@ -1,11 +1,13 @@
 from .s3 import S3Service
+from .local import LocalS3Service
 
 
 class AWSServiceFactory:
     @staticmethod
     def get_service(service: str, config: dict):
         catalog = {
-            'S3': S3Service
+            'S3': S3Service,
+            'LOCAL_S3': LocalS3Service
         }
         service_class = catalog.get(service.upper(), None)
         if not service_class:
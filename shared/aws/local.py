@@ -0,0 +1,59 @@
+import os
+import shutil
+from settings import settings
+
+
+class LocalS3Service:
+    '''Filesystem stand-in for S3Service, for local and end-to-end runs.
+    Objects live under LOCAL_STORAGE_DIR/<bucket>/<key> and "presigned"
+    URLs are plain paths that OpenCV, PyAV and ffmpeg read directly.'''
+
+    def __init__(self, bucket_name: str):
+        self.bucket = bucket_name
+        self.root = os.path.join(settings.LOCAL_STORAGE_DIR, bucket_name)
+        os.makedirs(self.root, exist_ok=True)
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def validate_s3_video_path(self, video_path: str) -> bool:
+        if not isinstance(video_path, str):
+            raise TypeError('Video path should be a string')
+
+        prefix = os.path.join(self.root, 'videos')
+        if not video_path.startswith(prefix):
+            raise ValueError('Returned string is not a valid path')
+
+        return True
+
+    def generate_presigned_url(self,
+                               operation: str,
+                               key: str = None,
+                               content_type: str = 'video/mp4',
+                               expiration: int = 3600) -> str:
+        return self.get_path(key)
+
+    def upload_file(self,
+                    filename: str,
+                    s3_key: str,
+                    content_type: str = 'application/octet-stream'):
+        path = self.get_path(s3_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(filename, path)
+
+    def upload_video_file(self, filename: str, s3_key: str):
+        self.upload_file(filename, s3_key, 'video/mp4')
+
+    def download_file(self, s3_key: str, filename: str):
+        shutil.copyfile(self.get_path(s3_key), filename)
+
+    def file_exists(self, s3_key: str) -> bool:
+        return os.path.isfile(self.get_path(s3_key))
+
+    def get_file_size(self, s3_key: str) -> int:
+        return os.path.getsize(self.get_path(s3_key))
+
+    def remove_file(self, key: str):
+        path = self.get_path(key)
+        if os.path.isfile(path):
+            os.remove(path)
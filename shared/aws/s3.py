@@ -82,6 +82,30 @@ class S3Service(BaseAWSService):
                                        s3_key,
                                 ExtraArgs={'ContentType': 'video/mp4'})
 
+    def upload_file(self,
+                    filename: str,
+                    s3_key: str,
+                    content_type: str = 'application/octet-stream'):
+        with open(filename, 'rb') as data:
+            self.client.upload_fileobj(data,
+                                       self.bucket,
+                                       s3_key,
+                                ExtraArgs={'ContentType': content_type})
+
+    def download_file(self, s3_key: str, filename: str):
+        self.client.download_file(self.bucket, s3_key, filename)
+
+    def file_exists(self, s3_key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=s3_key)
+            return True
+        except ClientError:
+            return False
+
+    def get_file_size(self, s3_key: str) -> int:
+        response = self.client.head_object(Bucket=self.bucket, Key=s3_key)
+        return response['ContentLength']
+
     def remove_file(self, key: str):
         self.client.delete_object(Bucket=self.bucket, Key=key)
 
@@ -1,6 +1,6 @@
 from sqlalchemy import (Column, text, ForeignKey, Float,
                         String, DateTime, Integer, Boolean)
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import declarative_base, relationship
 
 
@@ -42,6 +42,11 @@ class Video(Base):
     duration = Column(Integer)
     optimized_fps_ratio = Column(Float)
     optimized_s3_key = Column(String(150))
+    optimized_width = Column(Integer)
+    optimized_height = Column(Integer)
+    optimized_fps = Column(Integer)
+    optimized_total_frames = Column(Integer)
+    priority = Column(Integer)
     owner_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="videos")
@@ -61,12 +66,16 @@ class Measurement(Base):
     y1 = Column(Float)
     x2 = Column(Float)
     y2 = Column(Float)
+    counts_only = Column(Boolean)
+    roi_inference = Column(Boolean)
     output_s3_key = Column(String(150))
     detections_count = Column(Integer)
     global_frequency = Column(Float)
+    priority = Column(Integer)
 
     video = relationship("Video", back_populates="measurements")
     detections = relationship("Detection", back_populates="measurement")
+    clips = relationship("Clip", back_populates="measurement")
 
 
 class Detection(Base):
@@ -78,3 +87,31 @@ class Detection(Base):
     frequency = Column(Float)
 
     measurement = relationship("Measurement", back_populates="detections")
+
+
+class Clip(Base):
+    __tablename__ = "clips"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    measurement_id = Column(Integer, ForeignKey("measurements.id"))
+    created_at = Column(DateTime(timezone=True),
+                         server_default=text("(now() at time zone 'utc')"))
+    start_time = Column(Float)
+    end_time = Column(Float)
+    status = Column(String(15))
+    output_s3_key = Column(String(150))
+
+    measurement = relationship("Measurement", back_populates="clips")
+
+
+class TaskTiming(Base):
+    __tablename__ = "task_timings"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime(timezone=True),
+                         server_default=text("(now() at time zone 'utc')"))
+    task_type = Column(String(15))
+    video_id = Column(Integer, ForeignKey("videos.id"))
+    measurement_id = Column(Integer, ForeignKey("measurements.id"))
+    total_seconds = Column(Float)
+    frames = Column(Integer)
+    fps = Column(Float)
+    stages = Column(JSONB)
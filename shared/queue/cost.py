@@ -0,0 +1,61 @@
+import logging
+from settings import settings
+from shared.schemas.videos import VideoSchema
+from shared.schemas.measurements import MeasurementSchema
+
+
+logger = logging.getLogger(__name__)
+
+
+class TaskCost:
+    '''Estimates how long a task may be passed by cheaper ones, in seconds.
+    Queued tasks are ordered by enqueue time plus this delay, so a costly
+    task only waits behind tasks queued less than its delay after it, and
+    never more than MAX_DELAY. Priority points take PRIORITY_WEIGHT seconds
+    off the delay each, down to -MAX_DELAY.'''
+
+    UPLOAD_WEIGHT = settings.QUEUE_UPLOAD_COST_WEIGHT
+    FRAME_WEIGHT = settings.QUEUE_FRAME_COST_WEIGHT
+    PRIORITY_WEIGHT = settings.QUEUE_PRIORITY_WEIGHT
+    MAX_DELAY = settings.QUEUE_MAX_DELAY
+
+    def get_delay(self, cost: float, priority: int | None) -> float:
+        delay = min(max(cost, 0.0), self.MAX_DELAY)
+        delay -= (priority or 0) * self.PRIORITY_WEIGHT
+        # Bounded both ways so aging still overtakes any priority
+        return min(max(delay, -self.MAX_DELAY), self.MAX_DELAY)
+
+    def get_video_delay(self, video: VideoSchema, s3) -> float:
+        # Metadata is only known once optimized, uploads are sized instead
+        cost = self.get_frame_cost(video.total_frames,
+                                   video.width,
+                                   video.height)
+        if cost is None:
+            cost = self.get_upload_cost(video.input_s3_key, s3)
+        return self.get_delay(cost, video.priority)
+
+    def get_measurement_delay(self,
+                              measurement: MeasurementSchema,
+                              video: VideoSchema) -> float:
+        # Predictions run on the optimized video
+        cost = self.get_frame_cost(video.optimized_total_frames,
+                                   video.optimized_width,
+                                   video.optimized_height)
+        priority = measurement.priority \
+            if measurement.priority is not None else video.priority
+        return self.get_delay(cost or 0.0, priority)
+
+    def get_frame_cost(self,
+                       total_frames: int | None,
+                       width: int | None,
+                       height: int | None) -> float | None:
+        if not total_frames or not width or not height:
+            return None
+        return total_frames * width * height / 1e6 * self.FRAME_WEIGHT
+
+    def get_upload_cost(self, s3_key: str, s3) -> float:
+        try:
+            return s3.get_file_size(s3_key) / 1e6 * self.UPLOAD_WEIGHT
+        except Exception as e:
+            logger.warning(f'Upload {s3_key} could not be sized: {e}')
+            return 0.0
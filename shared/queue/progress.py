@@ -0,0 +1,87 @@
+import json
+import time
+from redis import Redis
+from settings import settings
+from shared.queue.queue import q
+
+
+TERMINAL_STATUSES = {'OPTIMIZED', 'PREDICTED', 'RENDERED', 'ERROR'}
+
+
+def get_progress_channel(kind: str, item_id: int):
+    return f'progress:{kind}:{item_id}'
+
+
+def get_progress_key(kind: str, item_id: int):
+    # Last published message, for subscribers joining mid-task
+    return f'{get_progress_channel(kind, item_id)}:last'
+
+
+class ProgressPublisher:
+    '''Publishes the progress of a video or measurement to Redis pub/sub.
+    Frame updates are throttled to one every PROGRESS_INTERVAL seconds,
+    status changes are always published.'''
+
+    INTERVAL = settings.PROGRESS_INTERVAL
+    TTL = settings.PROGRESS_TTL
+
+    def __init__(self,
+                 kind: str,
+                 item_id: int,
+                 total_frames: int = None,
+                 queue: Redis = q) -> None:
+        self.kind = kind
+        self.item_id = item_id
+        self.total_frames = total_frames
+        self.queue = queue
+        self.started_at = time.monotonic()
+        self.published_at = None
+
+    def is_due(self) -> bool:
+        return self.published_at is None or \
+            time.monotonic() - self.published_at >= self.INTERVAL
+
+    def update(self, frame: int, counts: dict = None, fps: float = None):
+        # Throughput is averaged since start unless the caller measures it
+        if not self.is_due():
+            return
+        now = time.monotonic()
+        self.published_at = now
+        elapsed = now - self.started_at
+        if fps is None and elapsed:
+            fps = frame / elapsed
+        message = {'frame': frame,
+                   'total_frames': self.total_frames,
+                   'fps': round(fps, 1) if fps is not None else None}
+        if self.total_frames:
+            message['progress'] = round(min(frame / self.total_frames, 1), 4)
+        if counts is not None:
+            message['counts'] = counts
+        self.publish(message)
+
+    def set_status(self, status: str, counts: dict = None):
+        message = {'status': status}
+        if counts is not None:
+            message['counts'] = counts
+        self.publish(message)
+
+    def publish(self, message: dict):
+        message = json.dumps({'kind': self.kind,
+                              'id': self.item_id,
+                              'timestamp': time.time(),
+                              **message})
+        try:
+            pipeline = self.queue.pipeline()
+            pipeline.publish(get_progress_channel(self.kind, self.item_id),
+                             message)
+            pipeline.set(get_progress_key(self.kind, self.item_id),
+                         message,
+                         ex=self.TTL)
+            pipeline.execute()
+        except Exception:
+            # Progress is best effort and never fails a task
+            pass
+
+
+def publish_status(kind: str, item_id: int, status: str):
+    ProgressPublisher(kind, item_id).set_status(status)
@@ -0,0 +1,195 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from redis import Redis
+from settings import settings
+from shared.queue.queue import q
+
+
+logger = logging.getLogger(__name__)
+
+
+# A worker is only reaped if its heartbeat is still lapsed, its tasks go
+# back to the front of the queue
+REAP_SCRIPT = '''
+local deadline = redis.call('ZSCORE', KEYS[3], ARGV[2])
+if deadline and tonumber(deadline) > tonumber(ARGV[1]) then
+    return {}
+end
+redis.call('ZREM', KEYS[3], ARGV[2])
+local requeued = redis.call('LRANGE', KEYS[2], 0, -1)
+for _, task in ipairs(requeued) do
+    redis.call('ZADD', KEYS[1], 0, task)
+    redis.call('LPUSH', KEYS[4], 1)
+end
+redis.call('DEL', KEYS[2])
+return requeued
+'''
+
+# Signals only wake waiters up, an empty queue drops the stale ones
+POP_SCRIPT = '''
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if #popped == 0 then
+    redis.call('DEL', KEYS[3])
+    return false
+end
+redis.call('LPUSH', KEYS[2], popped[1])
+return popped[1]
+'''
+
+CLAIM_SCRIPT = '''
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('LPUSH', KEYS[2], ARGV[1])
+return 1
+'''
+
+
+class ReliableQueue:
+    '''Task queue over a Redis sorted set, popped lowest score first. Pops
+    block on a signal list pushed along with every task. Each instance is
+    a worker with a unique ID: popped tasks move atomically to the worker's
+    own WIP list, and a background heartbeat keeps the worker registered
+    in a sorted set scored by its deadline. Tasks are acknowledged by ID,
+    and reap puts the tasks of workers whose heartbeat lapsed back at the
+    front of the queue.'''
+
+    HEARTBEAT_TIMEOUT = settings.QUEUE_HEARTBEAT_TIMEOUT
+    BLOCK_TIMEOUT = settings.QUEUE_BLOCK_TIMEOUT
+
+    def __init__(self,
+                 name: str,
+                 worker_id: str = None,
+                 queue: Redis = q) -> None:
+        self.name = name
+        self.worker_id = worker_id or self.generate_worker_id()
+        self.todo = f'{name}_TODO'
+        self.error = f'{name}_ERROR'
+        self.workers = f'{name}_WORKERS'
+        self.reaper = f'{name}_REAPER'
+        self.signal = f'{name}_SIGNAL'
+        self.wip = self.get_wip_key(self.worker_id)
+        self.queue = queue
+        self.reap_script = queue.register_script(REAP_SCRIPT)
+        self.claim_script = queue.register_script(CLAIM_SCRIPT)
+        self.pop_script = queue.register_script(POP_SCRIPT)
+        self.heartbeat_thread = None
+
+    @staticmethod
+    def generate_worker_id():
+        return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+    def get_wip_key(self, worker_id: str):
+        return f'{self.name}_WIP:{worker_id}'
+
+    def get_wip_keys(self) -> list[str]:
+        return [key.decode()
+                for key in self.queue.scan_iter(f'{self.name}_WIP:*')]
+
+    def get_deadline(self) -> float:
+        return time.time() + self.HEARTBEAT_TIMEOUT
+
+    def push(self, task: int, delay: float = 0.0):
+        # Tasks are scored by enqueue time, delayed by their cost
+        pipeline = self.queue.pipeline()
+        pipeline.zadd(self.todo, {task: time.time() + delay})
+        pipeline.lpush(self.signal, 1)
+        pipeline.execute()
+
+    def pop(self, timeout: int = None) -> int | None:
+        # Registered first, tasks never sit in the WIP list of an unknown
+        # worker
+        self.start_heartbeat()
+        timeout = self.BLOCK_TIMEOUT if timeout is None else timeout
+        keys = [self.todo, self.wip, self.signal]
+        task = self.pop_script(keys=keys)
+        if task is None and self.queue.blpop(self.signal, timeout):
+            task = self.pop_script(keys=keys)
+        return None if task is None else int(task)
+
+    def claim(self, task: int) -> bool:
+        # Only one worker can remove a given task from the queue
+        self.start_heartbeat()
+        claimed = self.claim_script(keys=[self.todo, self.wip], args=[task])
+        return bool(claimed)
+
+    def release(self, task: int, target: str = None):
+        pipeline = self.queue.pipeline()
+        pipeline.lrem(self.wip, 1, task)
+        if target:
+            pipeline.lpush(target, task)
+        pipeline.execute()
+
+    def ack(self, task: int):
+        self.release(task)
+
+    def fail(self, task: int):
+        self.release(task, self.error)
+
+    def reap(self, interval: float) -> list[int]:
+        # The worker taking the reaper lock coordinates for the interval
+        if not self.queue.set(self.reaper, self.worker_id,
+                              nx=True, px=int(interval * 1000)):
+            return []
+        registered = {worker_id.decode() for worker_id
+                      in self.queue.zrange(self.workers, 0, -1)}
+        # WIP lists of workers that were reaped while still running get a
+        # deadline before they can be reaped in turn
+        prefix = len(self.get_wip_key(''))
+        for key in self.get_wip_keys():
+            if key[prefix:] not in registered:
+                self.queue.zadd(self.workers,
+                                {key[prefix:]: self.get_deadline()},
+                                nx=True)
+        now = time.time()
+        requeued = []
+        for worker_id in self.queue.zrangebyscore(self.workers, '-inf', now):
+            worker_id = worker_id.decode()
+            tasks = self.reap_script(keys=[self.todo,
+                                           self.get_wip_key(worker_id),
+                                           self.workers,
+                                           self.signal],
+                                     args=[now, worker_id])
+            if tasks:
+                logger.info(f'Worker {worker_id} of {self.name} lapsed, '
+                            f'requeued {len(tasks)} tasks')
+            requeued += [int(task) for task in tasks]
+        return requeued
+
+    def register(self) -> bool:
+        # False if the worker had been reaped
+        registered = self.queue.zadd(self.workers,
+                                     {self.worker_id: self.get_deadline()},
+                                     xx=True,
+                                     ch=True)
+        if not registered:
+            self.queue.zadd(self.workers,
+                            {self.worker_id: self.get_deadline()})
+        return bool(registered)
+
+    def start_heartbeat(self):
+        if self.heartbeat_thread is not None:
+            return
+        self.queue.zadd(self.workers, {self.worker_id: self.get_deadline()})
+        self.heartbeat_thread = threading.Thread(target=self.beat,
+                                                 daemon=True)
+        self.heartbeat_thread.start()
+        logger.info(f'Registered {self.name} worker {self.worker_id}')
+
+    def beat(self):
+        while True:
+            time.sleep(self.HEARTBEAT_TIMEOUT / 3)
+            try:
+                registered = self.register()
+            except Exception as e:
+                logger.warning(f'Heartbeat of {self.name} worker '
+                               f'{self.worker_id} failed: {e}')
+                continue
+            if not registered:
+                logger.warning(f'Heartbeat of {self.name} worker '
+                               f'{self.worker_id} lapsed, its tasks may '
+                               'run twice')
@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, ConfigDict
+
+
+class ClipSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    measurement_id: int
+    created_at: datetime
+    start_time: float
+    end_time: float
+    status: str
+    output_s3_key: Optional[str] = None
+    output_video_url: Optional[str] = None
+
+
+class NewClip(BaseModel):
+    measurement_id: int = None
+    start_time: float
+    end_time: float
+    status: str = 'QUEUED'
+
+
+class UpdateClip(BaseModel):
+    status: str = None
+    output_s3_key: str = None
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 from uuid import uuid4
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class DetectionSchema(BaseModel):
@@ -33,11 +33,14 @@ class MeasurementSchema(BaseMeasurement):
     y1: Optional[float] = None
     x2: Optional[float] = None
     y2: Optional[float] = None
+    counts_only: Optional[bool] = False
+    roi_inference: Optional[bool] = False
     upload_url: Optional[str] = None
     output_s3_key: Optional[str] = None
     output_video_url: Optional[str] = None
     detections_count: Optional[int] = None
     global_frequency: Optional[float] = None
+    priority: Optional[int] = None
     detections: list[DetectionSchema] | None = None
 
 
@@ -49,7 +52,10 @@ class NewMeasurement(BaseMeasurement):
     y1: float = -1.0
     x2: float = -1.0
     y2: float = -1.0
+    counts_only: bool = False
+    roi_inference: bool = False
     status: str = 'REQUESTED'
+    priority: int = Field(None, ge=-10, le=10)
 
 
 class UpdateMeasurementAPI(BaseMeasurement):
@@ -0,0 +1,22 @@
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict
+
+
+class StageTimingSchema(BaseModel):
+    seconds: float
+    frames: int = 0
+    fps: float = None
+
+
+class TaskTimingSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int = None
+    created_at: datetime = None
+    task_type: str
+    video_id: int
+    measurement_id: int = None
+    total_seconds: float
+    frames: int = 0
+    fps: float = None
+    stages: dict[str, StageTimingSchema] = {}
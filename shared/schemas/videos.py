@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from typing import Optional
 from uuid import uuid4
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 import numpy as np
 from .measurements import MeasurementSchema
 
@@ -30,7 +30,12 @@ class VideoSchema(BaseVideo):
     duration: Optional[int] = None
     optimized_fps_ratio: Optional[float] = None
     optimized_s3_key: Optional[str] = None
+    optimized_width: Optional[int] = None
+    optimized_height: Optional[int] = None
+    optimized_fps: Optional[int] = None
+    optimized_total_frames: Optional[int] = None
     optimized_video_url: Optional[str] = None
+    priority: Optional[int] = None
     measurements: list[MeasurementSchema] | None = None
 
 
@@ -39,6 +44,7 @@ class NewVideo(BaseVideo):
     input_s3_key: str = None
     created_at: datetime = datetime.now(tz=timezone.utc)
     status: str = 'CREATED'
+    priority: int = Field(None, ge=-10, le=10)
 
 
 class UpdateVideoAPI(BaseVideo):
@@ -56,6 +62,10 @@ class UpdateVideoInternal(BaseVideo):
     duration: int = None
     optimized_fps_ratio: float = None
     optimized_s3_key: str = None
+    optimized_width: int = None
+    optimized_height: int = None
+    optimized_fps: int = None
+    optimized_total_frames: int = None
 
 
 class FrameDetection(BaseModel):
@@ -1,7 +1,8 @@
 from uuid import uuid4
 from settings import settings
 from shared.database.crud import CRUDManager
-from shared.database.models import Video, Measurement, Detection
+from shared.database.models import (Video, Measurement, Detection,
+                                    Clip, TaskTiming)
 from shared.schemas.videos import (VideoSchema,
                                    NewVideo,
                                    UpdateVideoAPI,
@@ -11,13 +12,15 @@ from shared.schemas.measurements import (MeasurementSchema,
                                          UpdateMeasurementAPI,
                                          UpdateMeasurementInternal,
                                          DetectionSchema)
+from shared.schemas.clips import ClipSchema, NewClip, UpdateClip
+from shared.schemas.timings import TaskTimingSchema
 from shared.aws.factory import AWSServiceFactory
 
 
 class VideoManager:
     def __init__(self, usage: str = 'external') -> None:
         s3_config = {'bucket_name': settings.AWS_BUCKET_NAME}
-        self.s3 = AWSServiceFactory.get_service(service='s3',
+        self.s3 = AWSServiceFactory.get_service(service=settings.STORAGE_SERVICE,
                                                 config=s3_config)
         update_classes = {
             'video': {
@@ -43,6 +46,14 @@ class VideoManager:
                                         pydantic_create=DetectionSchema,
                                         pydantic_update=DetectionSchema,
                                         pydantic_response=DetectionSchema)
+        self.crud_clip = CRUDManager(db_model=Clip,
+                                     pydantic_create=NewClip,
+                                     pydantic_update=UpdateClip,
+                                     pydantic_response=ClipSchema)
+        self.crud_timing = CRUDManager(db_model=TaskTiming,
+                                       pydantic_create=TaskTimingSchema,
+                                       pydantic_update=TaskTimingSchema,
+                                       pydantic_response=TaskTimingSchema)
 
     def create_video(self, user_id: int, video: NewVideo) -> VideoSchema:
         video.owner_id = user_id
@@ -61,7 +72,8 @@ class VideoManager:
     def create_measurement(self, video_id: int,
                            measurement: NewMeasurement) -> MeasurementSchema:
         measurement.video_id = video_id
-        measurement.output_s3_key = self.generate_video_key('predictions')
+        if not measurement.counts_only:
+            measurement.output_s3_key = self.generate_video_key('predictions')
         get_coord = lambda m: [m.x1, m.y1, m.x2, m.y2]
         coordinate_cond = [all([isinstance(c, float), 0<=c<=1])
                            for c in get_coord(measurement)]
@@ -83,6 +95,20 @@ class VideoManager:
                                                     item_create=detection)
         return saved
     
+    def create_clip(self, measurement_id: int, clip: NewClip) -> ClipSchema:
+        clip.measurement_id = measurement_id
+        with self.crud_clip.db.get_session() as session:
+            saved = self.crud_clip.create_item(session=session,
+                                               item_create=clip)
+        return saved
+
+    def create_task_timing(self,
+                           timing: TaskTimingSchema) -> TaskTimingSchema:
+        with self.crud_timing.db.get_session() as session:
+            saved = self.crud_timing.create_item(session=session,
+                                                 item_create=timing)
+        return saved
+
     def update_video(self, video_id: int,
                      params: UpdateVideoAPI | UpdateVideoInternal
                      ) -> VideoSchema:
@@ -111,6 +137,14 @@ class VideoManager:
         params = UpdateMeasurementAPI(is_active=False)
         return self.update_measurement(measurement_id, params)
 
+    def update_clip(self, clip_id: int, params: UpdateClip) -> ClipSchema:
+        with self.crud_clip.db.get_session() as session:
+            updated = self.crud_clip.update_item(session=session,
+                                                 item_id=clip_id,
+                                                 item_update=params)
+        updated = self.inject_urls(updated)
+        return updated
+
     def get_video(self, video_id: int):
         with self.crud_video.db.get_session() as session:
             video = self.crud_video.get_item(session=session,
@@ -143,6 +177,22 @@ class VideoManager:
         measurement = self.inject_urls(measurement)
         return measurement
 
+    def get_clip(self, clip_id: int):
+        with self.crud_clip.db.get_session() as session:
+            clip = self.crud_clip.get_item(session=session, item_id=clip_id)
+        clip = self.inject_urls(clip)
+        return clip
+
+    def get_measurement_clip(self, measurement_id: int,
+                             start_time: float, end_time: float):
+        with self.crud_clip.db.get_session() as session:
+            clip = self.crud_clip.get_item_by_field(session=session,
+                                                    measurement_id=measurement_id,
+                                                    start_time=start_time,
+                                                    end_time=end_time)
+        clip = self.inject_urls(clip)
+        return clip
+
     def generate_video_key(self, stage: str):
         id = str(uuid4())
         key = f'videos/{stage}/{id}.mp4'
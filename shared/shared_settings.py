@@ -16,3 +16,15 @@ class SharedSettings(BaseSettings):
     AWS_KEY_ID: str
     AWS_SECRET: str
     AWS_BUCKET_NAME: str
+    PROGRESS_INTERVAL: float = 1.0
+    PROGRESS_TTL: int = 3600
+    STORAGE_SERVICE: str = 's3'
+    LOCAL_STORAGE_DIR: str = '/tmp/storage'
+    CLIP_MAX_DURATION: int = 60
+    QUEUE_HEARTBEAT_TIMEOUT: int = 60
+    QUEUE_BLOCK_TIMEOUT: int = 5
+    QUEUE_REAP_INTERVAL: int = 30
+    QUEUE_UPLOAD_COST_WEIGHT: float = 1.0
+    QUEUE_FRAME_COST_WEIGHT: float = 0.01
+    QUEUE_PRIORITY_WEIGHT: float = 600
+    QUEUE_MAX_DELAY: int = 3600
@@ -0,0 +1,22 @@
+import os
+
+
+# Micro-benchmarks never reach Postgres, Redis or S3, but importing the service
+# modules still builds the settings, which require these variables
+OFFLINE_ENVIRONMENT = {
+    'POSTGRES_HOST': 'localhost',
+    'POSTGRES_PORT': '5432',
+    'POSTGRES_DB': 'benchmarks',
+    'POSTGRES_USER': 'benchmarks',
+    'POSTGRES_PASSWORD': 'benchmarks',
+    'REDIS_HOST': 'localhost',
+    'REDIS_PORT': '6379',
+    'REDIS_PASSWORD': '',
+    'AWS_REGION': 'us-east-1',
+    'AWS_KEY_ID': 'benchmarks',
+    'AWS_SECRET': 'benchmarks',
+    'AWS_BUCKET_NAME': 'benchmarks',
+}
+
+for name, value in OFFLINE_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,81 @@
+'''Offline benchmarks for the frame-processing hot paths.
+
+Run from the service source directory:
+    python -m benchmarks run --width 1280 --height 720 --fps 30 --seconds 10
+    python -m benchmarks run --suites inference --batch-sizes 4 8 16
+    python -m benchmarks compare base.json new.json
+'''
+import os
+import argparse
+import tempfile
+from benchmarks.synthetic import SyntheticScene, write_synthetic_video
+from benchmarks.suites import (OptimizerBenchmark,
+                               PredictorBenchmark,
+                               InferenceBenchmark)
+from benchmarks.report import save_report, compare_reports
+
+
+def run(args):
+    scene = SyntheticScene(args.width, args.height, args.objects, args.seed)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        source_path = os.path.join(work_dir, 'source.mp4')
+        video_info = write_synthetic_video(source_path, scene, args.fps,
+                                           args.seconds)
+        if 'optimizer' in args.suites:
+            results += OptimizerBenchmark(source_path, video_info,
+                                          work_dir, args.repeat).run()
+    if 'predictor' in args.suites:
+        frames = min(args.frames, video_info.total_frames)
+        results += PredictorBenchmark(scene, video_info,
+                                      frames, args.repeat).run()
+    if 'inference' in args.suites:
+        frames = min(args.frames, video_info.total_frames)
+        results += InferenceBenchmark(scene, frames, args.batch_sizes,
+                                      args.repeat).run()
+    config = {key: value for key, value in vars(args).items()
+              if key not in ('command', 'output')}
+    save_report(args.output, config, results)
+    for result in results:
+        print(f"{result['group']:<10} {result['name']:<38} "
+              f"{str(result['fps']):>10} fps "
+              f"{str(result['ms_per_frame']):>10} ms")
+    print(f'Saved {args.output}')
+
+
+def compare(args):
+    for group, name, base_fps, new_fps, speedup in compare_reports(args.base,
+                                                                   args.new):
+        print(f'{group:<10} {name:<38} {base_fps:>10} -> {new_fps:>10} fps '
+              f'({speedup:.2f}x)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Frame processing benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--width', type=int, default=1280)
+    run_parser.add_argument('--height', type=int, default=720)
+    run_parser.add_argument('--fps', type=int, default=30)
+    run_parser.add_argument('--seconds', type=float, default=10)
+    run_parser.add_argument('--objects', type=int, default=8)
+    run_parser.add_argument('--frames', type=int, default=300,
+                            help='frames per predictor benchmark')
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--batch-sizes', type=int, nargs='+',
+                            default=[4, 8, 16],
+                            help='inference batch sizes compared against 1')
+    # The inference suite loads the real model, so it is opt-in
+    run_parser.add_argument('--suites', nargs='+',
+                            choices=['optimizer', 'predictor', 'inference'],
+                            default=['optimizer', 'predictor'])
+    run_parser.add_argument('--output', default='benchmark.json')
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args)
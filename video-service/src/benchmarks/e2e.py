@@ -0,0 +1,215 @@
+'''End-to-end throughput and accuracy harness.
+
+Pushes a labelled corpus of clips through the real OptimizerOrchestrator and
+PredictorOrchestrator threads, against local stand-ins: filesystem storage
+(LocalS3Service) plus a local Redis and Postgres, e.g. the docker-compose
+ones with REDIS_HOST and POSTGRES_HOST pointing at them. The harness
+empties the task queues before it starts, never run it against production.
+
+Run from the service source directory:
+    python -m benchmarks.e2e corpus.json --output e2e.json
+
+The corpus is a JSON list of clips, paths relative to the corpus file:
+    [{"path": "clips/intersection.mp4",
+      "measurements": [{"x1": 0.1, "y1": 0.5, "x2": 0.9, "y2": 0.5,
+                        "counts_only": true,
+                        "ground_truth": {"CAR": 12, "TRUCK": 2}}]}]
+'''
+import os
+
+# Clips and outputs stay on the local filesystem, never in a real bucket
+os.environ['STORAGE_SERVICE'] = 'local_s3'
+
+import json
+import time
+import logging
+import argparse
+import threading
+import numpy as np
+from settings import settings
+from shared.shared_settings import SharedSettings
+from shared.log_config import setup_logger
+from shared.queue.queue import q
+from shared.queue.reliable import ReliableQueue
+from shared.queue.cost import TaskCost
+from shared.service.videos import VideoManager
+from shared.schemas.videos import NewVideo, UpdateVideoAPI
+from shared.schemas.measurements import NewMeasurement
+from orchestrators import OptimizerOrchestrator, PredictorOrchestrator
+from benchmarks.report import get_environment
+
+
+logger = logging.getLogger(__name__)
+
+
+class EndToEndHarness:
+    QUEUES = ['VIDEO', 'MEASUREMENTS']
+    VIDEO_DONE = {'OPTIMIZED', 'ERROR'}
+    MEASUREMENT_DONE = {'PREDICTED', 'ERROR'}
+    POLL_INTERVAL = 0.5
+    MEASUREMENT_FIELDS = ['x1', 'y1', 'x2', 'y2', 'counts_only', 'roi_inference']
+
+    def __init__(self, corpus_path: str, timeout: float = 3600) -> None:
+        self.corpus_path = corpus_path
+        self.timeout = timeout
+        self.manager = VideoManager('internal')
+        self.submitted_at = {}
+        self.finished_at = {}
+        self.statuses = {}
+        self.ground_truth = {}
+
+    def load_corpus(self):
+        with open(self.corpus_path) as file:
+            corpus = json.load(file)
+        directory = os.path.dirname(os.path.abspath(self.corpus_path))
+        for clip in corpus:
+            clip['path'] = os.path.join(directory, clip['path'])
+        return corpus
+
+    def submit(self, clip: dict):
+        # Same steps as the upload and confirm-upload API routes
+        name = os.path.basename(clip['path'])
+        video = self.manager.create_video(None, NewVideo(name=name))
+        self.manager.s3.upload_video_file(clip['path'], video.input_s3_key)
+        for index, spec in enumerate(clip.get('measurements', [])):
+            fields = {field: spec[field] for field in self.MEASUREMENT_FIELDS
+                      if field in spec}
+            measurement = self.manager.create_measurement(
+                video.id,
+                NewMeasurement(name=f'{name}-{index}', **fields))
+            key = ('measurement', measurement.id)
+            self.submitted_at[key] = time.monotonic()
+            self.ground_truth[measurement.id] = spec.get('ground_truth')
+        video = self.manager.update_video(video.id,
+                                          UpdateVideoAPI(status='QUEUED'))
+        self.submitted_at[('video', video.id)] = time.monotonic()
+        delay = TaskCost().get_video_delay(video, self.manager.s3)
+        ReliableQueue('VIDEO').push(video.id, delay)
+        return video.id
+
+    def start_workers(self):
+        for orchestrator in (OptimizerOrchestrator, PredictorOrchestrator):
+            threading.Thread(target=orchestrator, daemon=True).start()
+
+    def poll(self, video_ids: list[int]):
+        for video_id in video_ids:
+            video = self.manager.get_video(video_id)
+            tasks = [('video', video_id, video.status, self.VIDEO_DONE)]
+            tasks += [('measurement', m.id, m.status, self.MEASUREMENT_DONE)
+                      for m in video.measurements or []]
+            for kind, item_id, status, done in tasks:
+                key = (kind, item_id)
+                if status in done and key not in self.finished_at:
+                    self.finished_at[key] = time.monotonic()
+                    self.statuses[key] = status
+
+    def wait(self, video_ids: list[int]):
+        deadline = time.monotonic() + self.timeout
+        while len(self.finished_at) < len(self.submitted_at):
+            if time.monotonic() > deadline:
+                raise TimeoutError('Corpus did not finish before the timeout')
+            time.sleep(self.POLL_INTERVAL)
+            self.poll(video_ids)
+
+    def get_latencies(self, kind: str):
+        latencies = [self.finished_at[key] - self.submitted_at[key]
+                     for key in self.finished_at if key[0] == kind]
+        if not latencies:
+            return {}
+        return {'count': len(latencies),
+                'p50': round(float(np.percentile(latencies, 50)), 3),
+                'p95': round(float(np.percentile(latencies, 95)), 3),
+                'max': round(max(latencies), 3)}
+
+    def get_count_errors(self):
+        rows = []
+        for measurement_id, truth in self.ground_truth.items():
+            if truth is None:
+                continue
+            measurement = self.manager.get_measurement(measurement_id)
+            predicted = {d.class_name: d.count
+                         for d in measurement.detections or []}
+            for class_name in sorted(set(truth) | set(predicted)):
+                expected = truth.get(class_name, 0)
+                actual = predicted.get(class_name, 0)
+                rows.append({'measurement_id': measurement_id,
+                             'class_name': class_name,
+                             'ground_truth': expected,
+                             'predicted': actual,
+                             'error': actual - expected})
+        return rows
+
+    def summarize_count_errors(self, rows: list[dict]):
+        per_class = {}
+        for row in rows:
+            summary = per_class.setdefault(row['class_name'],
+                                           {'ground_truth': 0,
+                                            'predicted': 0,
+                                            'absolute_error': 0})
+            summary['ground_truth'] += row['ground_truth']
+            summary['predicted'] += row['predicted']
+            summary['absolute_error'] += abs(row['error'])
+        for summary in per_class.values():
+            truth = summary['ground_truth']
+            summary['relative_error'] = round(
+                summary['absolute_error'] / truth, 4) if truth else None
+        total_truth = sum(s['ground_truth'] for s in per_class.values())
+        total_error = sum(s['absolute_error'] for s in per_class.values())
+        return {'per_class': per_class,
+                'absolute_error': total_error,
+                'relative_error': round(total_error / total_truth, 4)
+                if total_truth else None}
+
+    def get_config(self):
+        # Video service settings only, shared ones hold credentials
+        return settings.model_dump(exclude=set(SharedSettings.model_fields))
+
+    def run(self):
+        corpus = self.load_corpus()
+        for name in self.QUEUES:
+            queue = ReliableQueue(name)
+            q.delete(queue.todo, queue.error, queue.workers, queue.reaper,
+                     queue.signal, *queue.get_wip_keys())
+        self.start_workers()
+        started_at = time.monotonic()
+        video_ids = [self.submit(clip) for clip in corpus]
+        self.wait(video_ids)
+        wall_seconds = time.monotonic() - started_at
+
+        failed = [f'{kind} {item_id}'
+                  for (kind, item_id), status in self.statuses.items()
+                  if status == 'ERROR']
+        count_errors = self.get_count_errors()
+        return {'environment': get_environment(),
+                'config': self.get_config(),
+                'videos': len(video_ids),
+                'measurements': len(self.ground_truth),
+                'failed': failed,
+                'wall_seconds': round(wall_seconds, 3),
+                'videos_per_hour': round(len(video_ids) * 3600
+                                         / wall_seconds, 2),
+                'latency': {'video': self.get_latencies('video'),
+                            'measurement': self.get_latencies('measurement')},
+                'count_error': self.summarize_count_errors(count_errors),
+                'counts': count_errors}
+
+
+if __name__ == '__main__':
+    setup_logger(logging.root)
+    parser = argparse.ArgumentParser(description='End-to-end harness')
+    parser.add_argument('corpus')
+    parser.add_argument('--timeout', type=float, default=3600)
+    parser.add_argument('--output', default='e2e.json')
+    args = parser.parse_args()
+    report = EndToEndHarness(args.corpus, args.timeout).run()
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    latency = report['latency']
+    logger.info(f"{report['videos_per_hour']} videos/hour | "
+                f"video p50 {latency['video'].get('p50')}s "
+                f"p95 {latency['video'].get('p95')}s | "
+                f"measurement p50 {latency['measurement'].get('p50')}s "
+                f"p95 {latency['measurement'].get('p95')}s | "
+                f"count error {report['count_error']['relative_error']} | "
+                f"{len(report['failed'])} failed")
+    logger.info(f'Saved {args.output}')
@@ -0,0 +1,57 @@
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+import cv2
+import numpy as np
+import supervision as sv
+
+
+def get_commit():
+    try:
+        completed = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                                   capture_output=True, text=True)
+        return completed.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def get_environment():
+    return {'commit': get_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'supervision': sv.__version__}
+
+
+def save_report(path: str, config: dict, results: list[dict]):
+    report = {'environment': get_environment(),
+              'config': config,
+              'results': results}
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+    return report
+
+
+def load_results(path: str):
+    with open(path) as file:
+        report = json.load(file)
+    return {(r['group'], r['name']): r for r in report['results']}
+
+
+def compare_reports(base_path: str, new_path: str):
+    base = load_results(base_path)
+    new = load_results(new_path)
+    rows = []
+    for key, result in new.items():
+        previous = base.get(key)
+        if not previous or not previous['seconds']:
+            continue
+        # Above 1 means the new run is faster
+        speedup = previous['seconds'] / result['seconds']
+        rows.append((*key, previous['fps'], result['fps'], speedup))
+    return rows
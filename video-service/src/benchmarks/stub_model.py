@@ -0,0 +1,35 @@
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+from benchmarks.synthetic import SyntheticScene
+
+
+class StubModel:
+    '''Stands in for the YOLO model and tracker: returns tracked Results
+    holding the scene's ground-truth boxes, one tracker id per object'''
+
+    def __init__(self, scene: SyntheticScene, names: dict) -> None:
+        self.scene = scene
+        self.names = names
+        self.index = 0
+
+    def predict(self, source: list[np.ndarray], **kwargs) -> list[Results]:
+        results = []
+        for frame in source:
+            results.append(self.get_result(self.index, frame))
+            self.index += 1
+        return results
+
+    def get_result(self, index: int, frame: np.ndarray) -> Results:
+        boxes = self.scene.get_boxes(index)
+        count = len(boxes)
+        tracker_id = np.arange(1, count + 1, dtype=np.float32)
+        confidence = np.linspace(0.5, 0.95, count, dtype=np.float32)
+        data = np.column_stack([boxes,
+                                tracker_id,
+                                confidence,
+                                self.scene.class_id.astype(np.float32)])
+        return Results(orig_img=frame,
+                       path='',
+                       names=self.names,
+                       boxes=torch.from_numpy(data))
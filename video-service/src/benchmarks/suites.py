@@ -0,0 +1,227 @@
+import os
+import time
+from types import SimpleNamespace
+from supervision.utils.video import VideoInfo
+from ultralytics.utils import yaml_load
+from ultralytics.utils.checks import check_yaml
+import core.predictor as predictor_module
+from core.optimizer import VideoOptimizer
+from core.predictor import VideoPredictor
+from core.timing import StageTimer
+from core.model import get_model
+from core.tracking import FrameTracker
+from benchmarks.synthetic import SyntheticScene
+from benchmarks.stub_model import StubModel
+
+
+class NullProgress:
+    def update(self, *args, **kwargs):
+        pass
+
+    def set_status(self, *args, **kwargs):
+        pass
+
+
+def get_result(group: str, name: str, frames: int, seconds: float,
+               stages: dict = None):
+    return {'group': group,
+            'name': name,
+            'frames': frames,
+            'seconds': round(seconds, 6),
+            'fps': round(frames / seconds, 2) if seconds else None,
+            'ms_per_frame': round(seconds * 1000 / frames, 4) if frames else None,
+            'stages': stages or {}}
+
+
+class OptimizerBenchmark:
+    '''Times every frame-level VideoOptimizer processor on a local video'''
+
+    GROUP = 'optimizer'
+    PROCESSORS = ['copy_video',
+                  'trim_video_fps',
+                  'rescale_video',
+                  'trim_video_fps_and_rescale']
+
+    def __init__(self, source_path: str, video_info: VideoInfo,
+                 work_dir: str, repeat: int = 1) -> None:
+        self.source_path = source_path
+        self.video_info = video_info
+        self.work_dir = work_dir
+        self.repeat = max(repeat, 1)
+
+    def get_optimizer(self):
+        # Skips __init__, which reads the video row and probes S3
+        optimizer = object.__new__(VideoOptimizer)
+        optimizer.video = SimpleNamespace(id=0,
+                                          input_video_url=self.source_path,
+                                          width=self.video_info.width,
+                                          height=self.video_info.height,
+                                          fps=self.video_info.fps,
+                                          total_frames=self.video_info.total_frames)
+        optimizer.progress = NullProgress()
+        optimizer.timer = StageTimer()
+        return optimizer
+
+    def get_kwargs(self, optimizer: VideoOptimizer, processor: str):
+        info = self.video_info
+        dimensions = (info.width, info.height)
+        target_dimensions = optimizer.get_target_dimensions(dimensions,
+                                                            min(dimensions))
+        fps_factor = min(optimizer.MAX_FPS / info.fps, 1)
+        resize = 'rescale' in processor
+        trim = 'trim' in processor
+        width, height = target_dimensions if resize else dimensions
+        kwargs = {'video_info': VideoInfo(width=width,
+                                          height=height,
+                                          fps=round(info.fps * fps_factor)
+                                          if trim else info.fps,
+                                          total_frames=info.total_frames)}
+        if resize:
+            kwargs['target_dimensions'] = target_dimensions
+        if trim:
+            kwargs['fps_factor'] = fps_factor
+        return kwargs
+
+    def run_processor(self, name: str):
+        best = None
+        for _ in range(self.repeat):
+            optimizer = self.get_optimizer()
+            target_path = os.path.join(self.work_dir, f'{name}.mp4')
+            start = time.perf_counter()
+            getattr(optimizer, name)(target_path,
+                                     **self.get_kwargs(optimizer, name))
+            seconds = time.perf_counter() - start
+            os.remove(target_path)
+            if best is None or seconds < best[0]:
+                stages = {stage: value.model_dump()
+                          for stage, value in optimizer.timer.get_stages().items()}
+                best = (seconds, stages)
+        seconds, stages = best
+        return get_result(self.GROUP, name, self.video_info.total_frames,
+                          seconds, stages)
+
+    def run(self):
+        return [self.run_processor(name) for name in self.PROCESSORS]
+
+
+class PredictorBenchmark:
+    '''Times the predictor's per-frame post-processing on Results produced
+    by a stubbed model. Frames and Results are generated outside of the
+    timed sections.'''
+
+    GROUP = 'predictor'
+
+    def __init__(self, scene: SyntheticScene, video_info: VideoInfo,
+                 frames: int, repeat: int = 1) -> None:
+        self.scene = scene
+        self.video_info = video_info
+        self.frames = frames
+        self.repeat = max(repeat, 1)
+        self.names = yaml_load(check_yaml('coco.yaml'))['names']
+        # Class names would otherwise be read from the model checkpoint
+        predictor_module.get_class_names = lambda: self.names
+        self.steps = {
+            'process_frame_detections': self.process_frame_detections,
+            'get_frame_labels': self.get_frame_labels,
+            'count_and_annotate_class_detections':
+                self.count_and_annotate_class_detections,
+            'box_annotator': self.box_annotator,
+            'line_annotator': self.line_annotator,
+            'annotate_frame': self.annotate_frame,
+        }
+
+    def get_predictor(self):
+        # Skips __init__, which reads the measurement and video rows
+        predictor = object.__new__(VideoPredictor)
+        predictor.video_info = self.video_info
+        predictor.measurement = SimpleNamespace(id=0,
+                                                video_id=0,
+                                                x1=0.5, y1=0.0,
+                                                x2=0.5, y2=1.0,
+                                                roi_inference=False,
+                                                counts_only=False)
+        predictor.timer = StageTimer()
+        predictor._instantiate_annotators()
+        return predictor
+
+    def process_frame_detections(self, predictor, frame, result, detections):
+        predictor.process_frame_detections(result)
+
+    def get_frame_labels(self, predictor, frame, result, detections):
+        predictor.get_frame_labels(detections)
+
+    def count_and_annotate_class_detections(self, predictor, frame, result,
+                                            detections):
+        predictor.count_and_annotate_class_detections(frame, detections)
+
+    def box_annotator(self, predictor, frame, result, detections):
+        predictor.box_annotator.annotate(
+            scene=frame,
+            detections=detections,
+            labels=predictor.get_frame_labels(detections))
+
+    def line_annotator(self, predictor, frame, result, detections):
+        counter, annotator = predictor.global_annotator
+        annotator.annotate(frame=frame, line_counter=counter)
+
+    def annotate_frame(self, predictor, frame, result, detections):
+        predictor.annotate_frame(frame, detections)
+
+    def run_step(self, name: str):
+        step = self.steps[name]
+        best = None
+        for _ in range(self.repeat):
+            predictor = self.get_predictor()
+            model = StubModel(self.scene, self.names)
+            seconds = 0.0
+            for index in range(self.frames):
+                frame = self.scene.get_frame(index)
+                result = model.get_result(index, frame)
+                detections = predictor.process_frame_detections(result)
+                start = time.perf_counter()
+                step(predictor, frame, result, detections)
+                seconds += time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        return get_result(self.GROUP, name, self.frames, best)
+
+    def run(self):
+        return [self.run_step(name) for name in self.steps]
+
+
+class InferenceBenchmark:
+    '''Times detection and tracking through FrameTracker with the real
+    model. A batch size of 1 is the per-frame baseline the batched sizes
+    are compared against. Frames are generated before the timed section.'''
+
+    GROUP = 'inference'
+
+    def __init__(self, scene: SyntheticScene, frames: int,
+                 batch_sizes: list[int], repeat: int = 1) -> None:
+        self.scene = scene
+        self.frames = [scene.get_frame(index) for index in range(frames)]
+        self.batch_sizes = sorted(set([1] + batch_sizes))
+        self.repeat = max(repeat, 1)
+
+    def run_batch_size(self, model, batch_size: int):
+        best = None
+        for _ in range(self.repeat):
+            timer = StageTimer()
+            tracker = FrameTracker(model, batch_size=batch_size, timer=timer)
+            start = time.perf_counter()
+            for _ in tracker.iter_tracked(enumerate(self.frames)):
+                pass
+            seconds = time.perf_counter() - start
+            if best is None or seconds < best[0]:
+                stages = {stage: value.model_dump()
+                          for stage, value in timer.get_stages().items()}
+                best = (seconds, stages)
+        seconds, stages = best
+        return get_result(self.GROUP, f'frame_tracker_batch_{batch_size}',
+                          len(self.frames), seconds, stages)
+
+    def run(self):
+        model = get_model()
+        # Warm-up pass, the first predict call sets up the predictor
+        model.predict(source=self.frames[:1], verbose=False)
+        return [self.run_batch_size(model, batch_size)
+                for batch_size in self.batch_sizes]
@@ -0,0 +1,57 @@
+import numpy as np
+from supervision.utils.video import VideoInfo, VideoSink
+
+
+class SyntheticScene:
+    '''Deterministic traffic-like scene: rectangles crossing the frame
+    horizontally in lanes, each with its own speed and class. Frames and
+    the ground-truth boxes for any frame index are generated on demand.'''
+
+    CLASS_IDS = [1, 2, 3, 5, 7]
+
+    def __init__(self, width: int, height: int, objects: int = 8,
+                 seed: int = 0) -> None:
+        self.width = width
+        self.height = height
+        random = np.random.default_rng(seed)
+        lanes = max(objects, 1)
+        self.size = np.stack([random.integers(width // 16, width // 8, objects),
+                              random.integers(height // 14, height // 7,
+                                              objects)], axis=1)
+        self.lane_y = (np.arange(objects) + 0.5) * height / lanes
+        self.speed = random.uniform(0.004, 0.02, objects) * width
+        self.offset = random.uniform(0, width, objects)
+        self.class_id = random.choice(self.CLASS_IDS, objects)
+        self.colors = random.integers(40, 255, (objects, 3), dtype=np.uint8)
+        # Static textured background, as cameras never see flat frames
+        self.background = random.integers(60, 120, (height, width, 3),
+                                          dtype=np.uint8)
+
+    def get_boxes(self, index: int) -> np.ndarray:
+        span = self.width + self.size[:, 0]
+        x1 = (self.offset + self.speed * index) % span - self.size[:, 0]
+        y1 = self.lane_y - self.size[:, 1] / 2
+        boxes = np.stack([x1, y1, x1 + self.size[:, 0], y1 + self.size[:, 1]],
+                         axis=1)
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, self.width - 1)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, self.height - 1)
+        return boxes.astype(np.float32)
+
+    def get_frame(self, index: int) -> np.ndarray:
+        frame = self.background.copy()
+        for (x1, y1, x2, y2), color in zip(self.get_boxes(index).astype(int),
+                                           self.colors):
+            frame[y1:y2, x1:x2] = color
+        return frame
+
+
+def write_synthetic_video(path: str, scene: SyntheticScene, fps: int,
+                          seconds: float) -> VideoInfo:
+    video_info = VideoInfo(width=scene.width,
+                           height=scene.height,
+                           fps=fps,
+                           total_frames=int(fps * seconds))
+    with VideoSink(path, video_info) as sink:
+        for index in range(video_info.total_frames):
+            sink.write_frame(scene.get_frame(index))
+    return video_info
@@ -0,0 +1,169 @@
+import logging
+from contextlib import ExitStack
+import numpy as np
+import supervision as sv
+from supervision.utils.video import VideoSink
+from settings import settings
+from core.counter import LineCrossingCounter
+from core.predictor import VideoPredictor
+from core.checkpoint import PredictionCheckpoint, SegmentedVideoSink
+from core.chunks import ChunkedTracker
+from core.timing import StageTimer
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_measurements_output_paths(predictors: list[VideoPredictor]):
+    # Counts-only measurements get no annotated output
+    return [None if predictor.measurement.counts_only
+            else predictor.get_output_paths()
+            for predictor in predictors]
+
+
+def save_measurements_outputs(predictors: list[VideoPredictor],
+                              output_paths: list[tuple | None]):
+    for predictor, paths in zip(predictors, output_paths):
+        if paths:
+            predictor.save_output(*paths)
+        else:
+            predictor.save_result_statistics(output_s3_key=None)
+    for predictor in predictors:
+        predictor.save_timing()
+
+
+def share_timer(predictors: list[VideoPredictor], timer: StageTimer):
+    # Measurements of one pass report the timings of the whole pass
+    for predictor in predictors:
+        predictor.timer = timer
+
+
+def share_line_counter(predictors: list[VideoPredictor]):
+    # One counter holds every measurement's line, so all (line, class)
+    # pairs are updated in a single step per frame
+    lines = [predictor.line for predictor in predictors]
+    line_counter = LineCrossingCounter(lines, settings.ALLOWED_CLASS_ID)
+    for index, predictor in enumerate(predictors):
+        predictor.set_line_counter(line_counter, index, shared=True)
+    return line_counter
+
+
+def get_shared_roi(predictors: list[VideoPredictor]):
+    # Union of every measurement's region, full frame if any needs it
+    rois = [predictor.roi for predictor in predictors]
+    if any(roi is None for roi in rois):
+        return None
+    x1, y1, x2, y2 = zip(*rois)
+    return min(x1), min(y1), max(x2), max(y2)
+
+
+def get_motion_regions(predictors: list[VideoPredictor]):
+    return [region for predictor in predictors
+            for region in predictor.motion_regions]
+
+
+def track_in_chunks(lead: VideoPredictor):
+    # Long videos are tracked in parallel chunks up front, the pass then
+    # replays the stitched tracks as it would stored ones
+    motion_regions = lead.motion_regions if lead.MOTION_GATE else None
+    tracker = ChunkedTracker(lead.video_url,
+                             lead.video_info,
+                             lead.roi,
+                             motion_regions)
+    if tracker.get_chunk_count() <= 1 or lead.load_tracks() is not None:
+        return
+    with lead.timer.stage('chunked_tracking', lead.video_info.total_frames):
+        lead.tracks = tracker.track()
+    if lead.TRACK_STORE and tracker.is_full_inference:
+        lead.track_store.save_tracks(lead.measurement.video_id, lead.tracks)
+
+
+def process_measurements_frame(predictors: list[VideoPredictor],
+                               sinks: list[VideoSink | None],
+                               line_counter: LineCrossingCounter,
+                               frame: np.ndarray,
+                               detections: sv.Detections):
+    # Counting errors fail the task, the counts would be wrong otherwise
+    with predictors[0].timer.stage('count', 1):
+        line_counter.trigger(detections)
+    # Measurements without a sink are counts-only
+    for predictor, sink in zip(predictors, sinks):
+        if sink is None:
+            predictor.count_frame_detections(detections)
+            continue
+        try:
+            annotated = predictor.annotate_frame(frame.copy(), detections)
+        except Exception as e:
+            # The plain frame keeps the output in sync with the counts
+            logger.warning(f'Frame of measurement {predictor.measurement.id} '
+                           f'could not be annotated: {e}')
+            annotated = frame
+        with predictor.timer.stage('write', 1):
+            sink.write_frame(annotated)
+
+
+def update_measurements_progress(predictors: list[VideoPredictor],
+                                  frame: int):
+    for predictor in predictors:
+        predictor.update_progress(frame)
+
+
+class BatchVideoPredictor:
+    '''Predicts several measurements of the same video sharing a single
+    decoding and tracking pass'''
+
+    def __init__(self, measurement_ids: list[int]) -> None:
+        self.predictors = [VideoPredictor(measurement_id)
+                           for measurement_id in measurement_ids]
+        video_ids = {p.measurement.video_id for p in self.predictors}
+        if len(video_ids) > 1:
+            raise ValueError('Batched measurements must share the same video')
+
+    def predict(self):
+        predictors = self.predictors
+        output_paths = get_measurements_output_paths(predictors)
+        lead = predictors[0]
+        share_timer(predictors, lead.timer)
+        lead.roi = get_shared_roi(predictors)
+        lead.motion_regions = get_motion_regions(predictors)
+        line_counter = share_line_counter(predictors)
+        track_in_chunks(lead)
+        checkpoint = PredictionCheckpoint(lead.manager.s3,
+                                          predictors,
+                                          line_counter)
+        try:
+            self.predict_from_checkpoint(checkpoint,
+                                         output_paths,
+                                         line_counter)
+        except Exception:
+            # Failed tasks go to the error queue and never resume, only
+            # tasks requeued from a lapsed worker keep their checkpoint
+            checkpoint.remove()
+            raise
+        checkpoint.remove()
+
+    def predict_from_checkpoint(self,
+                                checkpoint: PredictionCheckpoint,
+                                output_paths: list,
+                                line_counter: LineCrossingCounter):
+        predictors = self.predictors
+        lead = predictors[0]
+        render = any(output_paths)
+        segments = checkpoint.restore(output_paths)
+        with ExitStack() as stack:
+            sinks = [stack.enter_context(SegmentedVideoSink(paths[1],
+                                                            lead.video_info,
+                                                            restored))
+                     if paths else None
+                     for paths, restored in zip(output_paths, segments)]
+            for index, (frame, detections) in enumerate(
+                    lead.iter_frame_detections(render), lead.start_frame):
+                process_measurements_frame(predictors,
+                                           sinks,
+                                           line_counter,
+                                           frame,
+                                           detections)
+                update_measurements_progress(predictors, index + 1)
+                checkpoint.update(index + 1, sinks)
+
+        save_measurements_outputs(predictors, output_paths)
@@ -0,0 +1,246 @@
+import os
+import time
+import pickle
+import logging
+import numpy as np
+from supervision.utils.video import VideoInfo, VideoSink
+from settings import settings
+from core.model import get_model_key
+from core.ffmpeg import concat_mp4
+from core.counter import LineCrossingCounter
+from core.predictor import VideoPredictor
+from shared.aws.s3 import S3Service
+
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentedVideoSink:
+    '''VideoSink writing the output as consecutive segments, joined into
+    target_path on a clean exit. Segments closed at a checkpoint survive
+    an interrupted task.'''
+
+    def __init__(self,
+                 target_path: str,
+                 video_info: VideoInfo,
+                 segments: list[str] = None) -> None:
+        self.target_path = target_path
+        self.video_info = video_info
+        self.segments = list(segments or [])
+        self.sink = None
+        self.path = None
+        self.frames = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close()
+        if exc_type is None:
+            self.join()
+
+    @staticmethod
+    def get_segment_path(target_path: str, index: int):
+        root, extension = os.path.splitext(target_path)
+        return f'{root}.part{index}{extension}'
+
+    def open(self):
+        self.path = self.get_segment_path(self.target_path,
+                                          len(self.segments))
+        self.sink = VideoSink(self.path, self.video_info)
+        self.sink.__enter__()
+        self.frames = 0
+
+    def close(self):
+        self.sink.__exit__(None, None, None)
+        if self.frames:
+            self.segments.append(self.path)
+        elif os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def rotate(self):
+        self.close()
+        self.open()
+
+    def write_frame(self, frame: np.ndarray):
+        self.sink.write_frame(frame)
+        self.frames += 1
+
+    def join(self):
+        if not self.segments:
+            return
+        if len(self.segments) == 1:
+            os.replace(self.segments[0], self.target_path)
+            return
+        concat_mp4(self.segments, self.target_path)
+        for path in self.segments:
+            os.remove(path)
+
+
+class PredictionCheckpoint:
+    '''Saves the state of a prediction pass every CHECKPOINT_INTERVAL
+    seconds: the next frame, the tracker, the line counters of every
+    measurement and the annotated output written so far. A retried pass
+    over the same measurements resumes from the last checkpoint.'''
+
+    INTERVAL = settings.CHECKPOINT_INTERVAL
+
+    def __init__(self,
+                 s3: S3Service,
+                 predictors: list[VideoPredictor],
+                 line_counter: LineCrossingCounter) -> None:
+        self.s3 = s3
+        self.predictors = predictors
+        self.lead = predictors[0]
+        self.line_counter = line_counter
+        ids = '-'.join(str(measurement_id) for measurement_id
+                       in sorted(p.measurement.id for p in predictors))
+        self.prefix = (f'checkpoints/{self.lead.measurement.video_id}/'
+                       f'{ids}/{get_model_key()}')
+        self.saved_at = time.monotonic()
+        # Uploaded output segments per measurement, in order
+        self.segment_keys = {}
+        self.exists = False
+
+    @property
+    def state_key(self):
+        return f'{self.prefix}/state.pkl'
+
+    def get_segment_key(self, measurement_id: int, index: int):
+        return f'{self.prefix}/{measurement_id}/{index}.mp4'
+
+    def get_local_path(self):
+        return os.path.join(os.getcwd(), self.state_key.replace('/', '_'))
+
+    def get_signature(self):
+        # Only passes producing the same detections can be resumed
+        return {'class_ids': list(settings.ALLOWED_CLASS_ID),
+                'roi': self.lead.roi,
+                'motion_gate': self.lead.MOTION_GATE,
+                'stored_tracks': self.lead.load_tracks() is not None}
+
+    def is_due(self):
+        return self.INTERVAL and \
+            time.monotonic() - self.saved_at >= self.INTERVAL
+
+    def load(self) -> dict | None:
+        if not self.s3.file_exists(self.state_key):
+            return None
+        path = self.get_local_path()
+        self.s3.download_file(self.state_key, path)
+        try:
+            with open(path, 'rb') as file:
+                return pickle.load(file)
+        finally:
+            os.remove(path)
+
+    def restore(self, output_paths: list[tuple | None]):
+        '''Resumes the pass from the stored checkpoint, if any. Returns the
+        local output segments already written for each measurement.'''
+        segments = [None] * len(self.predictors)
+        if not self.INTERVAL:
+            return segments
+        try:
+            state = self.load()
+            if state is None:
+                return segments
+            self.exists = True
+            self.segment_keys = state['segments']
+            if state['signature'] != self.get_signature():
+                logger.info('Checkpoint does not match the pass, '
+                            'predicting from the first frame')
+                self.remove()
+                return segments
+            segments = self.download_segments(output_paths)
+        except Exception as e:
+            logger.warning(f'Checkpoint could not be restored: {e}')
+            self.segment_keys = {}
+            return [None] * len(self.predictors)
+
+        self.lead.start_frame = state['frame']
+        self.lead.tracker_state = state['tracker']
+        for index, predictor in enumerate(self.predictors):
+            self.line_counter.set_state(
+                index,
+                state['counters'][predictor.measurement.id])
+        logger.info(f'Resuming checkpoint {self.prefix} '
+                    f'from frame {state["frame"]}')
+        return segments
+
+    def download_segments(self, output_paths: list[tuple | None]):
+        segments = []
+        for predictor, paths in zip(self.predictors, output_paths):
+            if not paths:
+                segments.append(None)
+                continue
+            keys = self.segment_keys.get(predictor.measurement.id, [])
+            local_paths = []
+            for index, key in enumerate(keys):
+                path = SegmentedVideoSink.get_segment_path(paths[1], index)
+                self.s3.download_file(key, path)
+                local_paths.append(path)
+            segments.append(local_paths)
+        return segments
+
+    def update(self,
+               frame: int,
+               sinks: list[SegmentedVideoSink | None]):
+        if not self.is_due() or not self.lead.is_tracker_synced(frame):
+            return
+        with self.lead.timer.stage('checkpoint'):
+            try:
+                self.save(frame, sinks)
+            except Exception as e:
+                # Checkpoints are best effort and never fail a task
+                logger.warning(f'Checkpoint could not be saved: {e}')
+        self.saved_at = time.monotonic()
+
+    def save(self,
+             frame: int,
+             sinks: list[SegmentedVideoSink | None]):
+        for predictor, sink in zip(self.predictors, sinks):
+            if sink is None:
+                continue
+            sink.rotate()
+            measurement_id = predictor.measurement.id
+            keys = self.segment_keys.setdefault(measurement_id, [])
+            # Segments left over by a failed upload go first
+            for path in sink.segments[len(keys):]:
+                key = self.get_segment_key(measurement_id, len(keys))
+                self.s3.upload_video_file(path, key)
+                keys.append(key)
+
+        tracker = self.lead.tracker
+        state = {
+            'signature': self.get_signature(),
+            'frame': frame,
+            'tracker': tracker.get_state() if tracker else None,
+            'counters': {predictor.measurement.id:
+                         self.line_counter.get_state(index)
+                         for index, predictor in enumerate(self.predictors)},
+            'segments': self.segment_keys
+        }
+        path = self.get_local_path()
+        with open(path, 'wb') as file:
+            pickle.dump(state, file)
+        try:
+            self.s3.upload_file(path, self.state_key)
+        finally:
+            os.remove(path)
+        self.exists = True
+        logger.info(f'Saved checkpoint {self.prefix} '
+                    f'at frame {frame}')
+
+    def remove(self):
+        if not self.exists:
+            return
+        try:
+            for keys in self.segment_keys.values():
+                for key in keys:
+                    self.s3.remove_file(key)
+            self.s3.remove_file(self.state_key)
+        except Exception as e:
+            logger.warning(f'Checkpoint could not be removed: {e}')
+        self.segment_keys = {}
+        self.exists = False
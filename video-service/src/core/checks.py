@@ -1,5 +1,92 @@
+import logging
+import numpy as np
+import torch
 from ultralytics import checks
+from ultralytics.engine.results import Results
+from ultralytics.utils import ROOT
+from ultralytics.utils.metrics import box_iou
+from settings import settings
+from core.model import initialize_model
+from core.tracking import FrameTracker
+
+
+logger = logging.getLogger(__name__)
 
 
 def get_ultralytics_checks():
     return checks()
+
+
+class BackendParityCheck:
+    '''Compares the detections of the configured inference backend against
+    the PyTorch model on the ultralytics sample images'''
+
+    CONFIDENCE = 0.25
+    MIN_IOU = 0.9
+    MAX_CONFIDENCE_DELTA = 0.05
+
+    def __init__(self,
+                 model_name: str = settings.MODEL_NAME,
+                 backend: str = settings.INFERENCE_BACKEND) -> None:
+        self.model_name = model_name
+        self.backend = backend
+
+    def run(self):
+        if self.backend == 'torch':
+            return
+        reference = initialize_model(self.model_name)
+        candidate = initialize_model(self.model_name, self.backend)
+        assets = ROOT / 'assets'
+        images = [str(path) for path in sorted(assets.glob('*.jpg'))]
+        for image in images:
+            expected = reference.predict(image,
+                                         conf=self.CONFIDENCE,
+                                         verbose=False)[0].boxes.cpu()
+            actual = candidate.predict(image,
+                                       conf=self.CONFIDENCE,
+                                       verbose=False)[0].boxes.cpu()
+            self.compare(image, expected, actual)
+        logger.info(f'{self.backend} backend matches PyTorch '
+                    f'on {len(images)} images')
+
+    def compare(self, image, expected, actual):
+        if len(expected) != len(actual):
+            raise RuntimeError(f'{self.backend} found {len(actual)} objects '
+                               f'in {image}, PyTorch found {len(expected)}')
+        if len(expected) == 0:
+            return
+        iou = box_iou(expected.xyxy, actual.xyxy)
+        same_class = expected.cls[:, None] == actual.cls[None, :]
+        best_iou, match = (iou * same_class).max(dim=1)
+        confidence_delta = (expected.conf - actual.conf[match]).abs()
+        if (best_iou < self.MIN_IOU).any() or \
+                (confidence_delta > self.MAX_CONFIDENCE_DELTA).any():
+            raise RuntimeError(f'{self.backend} detections in {image} '
+                               f'differ from PyTorch')
+
+
+def check_inference_backend():
+    # Quantized models are validated by the count gate instead
+    if settings.INFERENCE_PARITY_CHECK and \
+            settings.INFERENCE_PRECISION == 'fp32':
+        BackendParityCheck().run()
+
+
+def check_roi_offset():
+    # A box touching the right and bottom edges of the crop must keep its
+    # full frame coordinates once moved out of the ROI
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    roi = (400, 300, 800, 500)
+    tracker = FrameTracker(None, roi=roi)
+    crop = tracker.crop(frame)
+    box = [350.0, 150.0, 400.0, 200.0]
+    result = Results(orig_img=crop,
+                     path='',
+                     names={0: 'car'},
+                     boxes=torch.tensor([box + [0.9, 0.0]]))
+    result = tracker.offset(result, frame)
+    expected = [box[0] + roi[0], box[1] + roi[1],
+                box[2] + roi[0], box[3] + roi[1]]
+    if result.boxes.xyxy[0].tolist() != expected:
+        raise RuntimeError('ROI boxes are not moved to full frame '
+                           'coordinates')
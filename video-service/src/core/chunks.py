@@ -0,0 +1,228 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from supervision.detection.utils import box_iou_batch
+from supervision.utils.video import VideoInfo
+from settings import settings
+from core.model import get_model
+from core.tracking import FrameTracker
+from core.motion import MotionGate
+from core.decoder import DecoderFactory
+from core.tracks import TrackRecorder, VideoTracks
+from core.predictor import VideoPredictor
+
+
+logger = logging.getLogger(__name__)
+
+
+def track_chunk(source: str,
+                start_frame: int,
+                end_frame: int | None,
+                roi: tuple[int, int, int, int] | None,
+                motion_regions: list | None,
+                frame_size: tuple[int, int]) -> VideoTracks:
+    # Runs in a worker process, frame indexes are relative to start_frame
+    motion_gate = MotionGate(motion_regions, frame_size) \
+        if motion_regions else None
+    tracker = FrameTracker(get_model(), roi=roi, motion_gate=motion_gate)
+    recorder = TrackRecorder()
+    decoder = DecoderFactory.get_decoder(source,
+                                         start_frame=start_frame,
+                                         end_frame=end_frame)
+    with decoder:
+        for index, _, result in tracker.iter_tracked(decoder):
+            detections = VideoPredictor.get_tracked_detections(result)
+            recorder.add(index - start_frame, detections)
+    return recorder.to_tracks()
+
+
+class TrackStitcher:
+    '''Joins the tracks of consecutive overlapping chunks into tracks of
+    the whole video. Each chunk keeps its frames from its cut on, and its
+    track ids are matched to the previous chunk's by mean IoU over the
+    frames between the cut and the end of the previous chunk, where both
+    trackers have warmed up.'''
+
+    IOU_THRESHOLD = 0.5
+
+    def __init__(self) -> None:
+        self.next_id = 0
+        self.rows = {column: [] for column in VideoTracks.COLUMNS}
+
+    def stitch(self,
+               chunks: list[tuple[int, VideoTracks]],
+               cuts: list[int]) -> VideoTracks:
+        previous = None
+        for index, (start, tracks) in enumerate(chunks):
+            frames = tracks.frame_index + start
+            id_map = {}
+            if previous is not None:
+                window = (cuts[index], previous['end'])
+                id_map = self.match_ids(previous, frames, tracks, window)
+            tracker_id = self.map_ids(tracks.tracker_id, id_map)
+            keep = frames >= cuts[index]
+            if index + 1 < len(cuts):
+                keep &= frames < cuts[index + 1]
+            self.add_rows(frames[keep], tracks, tracker_id, keep)
+            previous = {'frames': frames,
+                        'tracker_id': tracker_id,
+                        'xyxy': tracks.xyxy,
+                        'end': start + tracks.frame_count}
+        start, tracks = chunks[-1]
+        return self.get_tracks(start + tracks.frame_count)
+
+    def match_ids(self,
+                  previous: dict,
+                  frames: np.ndarray,
+                  tracks: VideoTracks,
+                  window: tuple[int, int]) -> dict:
+        iou_sums = {}
+        previous_presence = {}
+        presence = {}
+        for frame in range(*window):
+            prev_rows = self.get_frame_rows(previous['frames'], frame,
+                                            previous['tracker_id'])
+            rows = self.get_frame_rows(frames, frame, tracks.tracker_id)
+            prev_ids = previous['tracker_id'][prev_rows]
+            ids = tracks.tracker_id[rows]
+            for track_ids, counts in ((prev_ids, previous_presence),
+                                      (ids, presence)):
+                for track_id in track_ids:
+                    counts[track_id] = counts.get(track_id, 0) + 1
+            if len(prev_rows) == 0 or len(rows) == 0:
+                continue
+            iou = box_iou_batch(previous['xyxy'][prev_rows],
+                                tracks.xyxy[rows])
+            for i, j in zip(*np.nonzero(iou)):
+                pair = (prev_ids[i], ids[j])
+                iou_sums[pair] = iou_sums.get(pair, 0.0) + iou[i, j]
+
+        # Greedy one to one matching, best mean IoU first
+        scores = sorted(((total / max(previous_presence[prev_id],
+                                      presence[track_id]),
+                          prev_id, track_id)
+                         for (prev_id, track_id), total in iou_sums.items()),
+                        reverse=True)
+        id_map = {}
+        matched = set()
+        for score, prev_id, track_id in scores:
+            if score < self.IOU_THRESHOLD:
+                break
+            if prev_id in matched or track_id in id_map:
+                continue
+            id_map[track_id] = prev_id
+            matched.add(prev_id)
+        return id_map
+
+    def get_frame_rows(self,
+                       frames: np.ndarray,
+                       frame: int,
+                       tracker_id: np.ndarray) -> np.ndarray:
+        # Rows are sorted by frame, unconfirmed detections are left out
+        start, end = np.searchsorted(frames, [frame, frame + 1])
+        rows = np.arange(start, end)
+        return rows[tracker_id[rows] >= 0]
+
+    def map_ids(self, tracker_id: np.ndarray, id_map: dict) -> np.ndarray:
+        unique, inverse = np.unique(tracker_id, return_inverse=True)
+        mapped = np.empty(len(unique), dtype=np.int32)
+        for index, track_id in enumerate(unique):
+            if track_id < 0:
+                mapped[index] = -1
+            elif track_id in id_map:
+                mapped[index] = id_map[track_id]
+            else:
+                self.next_id += 1
+                mapped[index] = self.next_id
+        return mapped[inverse]
+
+    def add_rows(self,
+                 frames: np.ndarray,
+                 tracks: VideoTracks,
+                 tracker_id: np.ndarray,
+                 keep: np.ndarray):
+        self.rows['frame_index'].append(frames.astype(np.int32))
+        self.rows['xyxy'].append(tracks.xyxy[keep])
+        self.rows['class_id'].append(tracks.class_id[keep])
+        self.rows['confidence'].append(tracks.confidence[keep])
+        self.rows['tracker_id'].append(tracker_id[keep])
+
+    def get_tracks(self, frame_count: int) -> VideoTracks:
+        columns = {column: np.concatenate(rows)
+                   for column, rows in self.rows.items()}
+        return VideoTracks(frame_count=frame_count, **columns)
+
+
+class ChunkedTracker:
+    '''Runs detection and tracking over overlapping time chunks of a video
+    in parallel worker processes, then stitches the chunk tracks'''
+
+    CHUNKS = settings.PREDICTION_CHUNKS
+    MIN_CHUNK_DURATION = settings.PREDICTION_MIN_CHUNK_DURATION
+    OVERLAP = settings.PREDICTION_CHUNK_OVERLAP
+
+    def __init__(self,
+                 source: str,
+                 video_info: VideoInfo,
+                 roi: tuple[int, int, int, int] = None,
+                 motion_regions: list = None) -> None:
+        self.source = source
+        self.video_info = video_info
+        self.roi = roi
+        self.motion_regions = motion_regions
+        # The cut sits in the middle of the overlap, each tracker gets half
+        # of it to pick up the objects already in scene
+        self.overlap = max(round(self.OVERLAP * (video_info.fps or 0)), 2)
+
+    @property
+    def is_full_inference(self):
+        return self.roi is None and not self.motion_regions
+
+    def get_chunk_count(self):
+        total_frames = self.video_info.total_frames
+        fps = self.video_info.fps
+        if not total_frames or not fps:
+            return 1
+        min_duration = max(self.MIN_CHUNK_DURATION, 2 * self.OVERLAP, 1)
+        chunks = min(self.CHUNKS, int(total_frames / fps // min_duration))
+        return max(chunks, 1)
+
+    def get_chunks(self, count: int):
+        total_frames = self.video_info.total_frames
+        boundaries = [round(total_frames * index / count)
+                      for index in range(count)]
+        chunks = []
+        cuts = []
+        for index, boundary in enumerate(boundaries):
+            start = max(boundary - self.overlap, 0) if index else 0
+            # The last chunk runs to the end, whatever the metadata says
+            end = boundaries[index + 1] if index + 1 < count else None
+            chunks.append((start, end))
+            cuts.append(boundary - self.overlap // 2 if index else 0)
+        return chunks, cuts
+
+    def track(self) -> VideoTracks:
+        count = self.get_chunk_count()
+        chunks, cuts = self.get_chunks(count)
+        frame_size = (self.video_info.width, self.video_info.height)
+        # Workers load their own model, forking after torch starts its
+        # threads is unsafe
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=count,
+                                 mp_context=context) as executor:
+            futures = [executor.submit(track_chunk,
+                                       self.source,
+                                       start,
+                                       end,
+                                       self.roi,
+                                       self.motion_regions,
+                                       frame_size)
+                       for start, end in chunks]
+            results = [future.result() for future in futures]
+
+        chunk_tracks = [(start, tracks)
+                        for (start, _), tracks in zip(chunks, results)]
+        tracks = TrackStitcher().stitch(chunk_tracks, cuts)
+        logger.info(f'Tracked {tracks.frame_count} frames in {count} chunks')
+        return tracks
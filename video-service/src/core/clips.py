@@ -0,0 +1,115 @@
+import os
+import math
+import logging
+from itertools import islice
+from supervision.utils.video import VideoInfo, VideoSink
+from settings import settings
+from core.predictor import VideoPredictor
+from core.ffmpeg import transcode_to_h264
+from shared.service.videos import VideoManager
+from shared.queue.progress import ProgressPublisher
+from shared.schemas.videos import VideoSchema
+from shared.schemas.clips import ClipSchema, UpdateClip
+
+
+logger = logging.getLogger(__name__)
+
+
+class ClipRenderer(VideoPredictor):
+    '''Renders an annotated clip of a measurement for a time range of the
+    optimized video. With stored tracks the line counts are replayed up to
+    the clip and frames are only decoded inside it. Otherwise inference
+    starts CLIP_WARMUP seconds early so the tracker has picked up the
+    objects in scene, and counts start from there.'''
+
+    WARMUP = settings.CLIP_WARMUP
+
+    def __init__(self, clip_id: int) -> None:
+        if not isinstance(clip_id, int):
+            raise TypeError('Clip ID should be integer')
+        self.clip: ClipSchema = VideoManager('internal').get_clip(clip_id)
+        super().__init__(self.clip.measurement_id)
+
+    def _get_video_metadata(self, video_info: VideoInfo = None):
+        # The measurement is left untouched, the clip tracks the progress
+        video: VideoSchema = self.manager.get_video(self.measurement.video_id)
+        self.video_url = video.optimized_video_url
+        self.video_duration = video.duration
+        self.video_info = self._get_optimized_video_info(video)
+        self.start, self.end = self.get_frame_range()
+
+        status = UpdateClip(status='PROCESSING')
+        self.clip = self.manager.update_clip(self.clip.id, status)
+        self.progress = ProgressPublisher('clip',
+                                          self.clip.id,
+                                          self.end - self.start)
+        self.progress.set_status(self.clip.status)
+
+    def get_frame_range(self):
+        fps = self.video_info.fps
+        start = int(self.clip.start_time * fps)
+        end = math.ceil(self.clip.end_time * fps)
+        if self.video_info.total_frames:
+            end = min(end, self.video_info.total_frames)
+        if end <= start:
+            raise ValueError('Clip range is outside the video')
+        return start, end
+
+    def render(self):
+        target_s3_key, _target_path, target_path = self.get_output_paths()
+        clip_info = VideoInfo(width=self.video_info.width,
+                              height=self.video_info.height,
+                              fps=self.video_info.fps,
+                              total_frames=self.end - self.start)
+        with VideoSink(_target_path, clip_info) as sink:
+            for index, (frame, detections) in enumerate(
+                    self.iter_clip_detections()):
+                frame = self.annotate_frame(frame, detections)
+                with self.timer.stage('write', 1):
+                    sink.write_frame(frame)
+                self.processed_frames = index + 1
+                self.progress.update(self.processed_frames)
+
+        with self.timer.stage('transcode'):
+            transcode_to_h264(_target_path, target_path)
+        with self.timer.stage('upload'):
+            self.manager.s3.upload_video_file(target_path, target_s3_key)
+        os.remove(target_path)
+        os.remove(_target_path)
+
+        status = UpdateClip(status='RENDERED', output_s3_key=target_s3_key)
+        self.clip = self.manager.update_clip(self.clip.id, status)
+        self.progress.set_status(self.clip.status, self.get_counts())
+        self.timer.save(self.manager,
+                        'clip',
+                        self.measurement.video_id,
+                        self.measurement.id,
+                        frames=self.processed_frames)
+
+    def get_output_paths(self):
+        target_s3_key = self.manager.generate_video_key('clips')
+        local_filename = target_s3_key.split("/")[-1]
+        _target_path = os.path.join(os.getcwd(), f'_{local_filename}')
+        target_path = os.path.join(os.getcwd(), local_filename)
+        return target_s3_key, _target_path, target_path
+
+    def iter_clip_detections(self):
+        tracks = self.load_tracks()
+        if tracks is not None:
+            with self.timer.stage('count', self.start):
+                for detections in islice(tracks.iter_frames(), self.start):
+                    self.line_counter.trigger(
+                        self.filter_detections(detections))
+            self.start_frame = self.start
+        else:
+            warmup = int(self.WARMUP * self.video_info.fps)
+            self.start_frame = max(self.start - warmup, 0)
+
+        for index, (frame, detections) in enumerate(
+                self.iter_frame_detections(), self.start_frame):
+            if index >= self.end:
+                break
+            if index < self.start:
+                self.count_frame_detections(detections)
+                continue
+            yield frame, detections
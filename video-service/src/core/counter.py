@@ -0,0 +1,143 @@
+import numpy as np
+import supervision as sv
+
+
+class LineCounterView:
+    '''Exposes one (line, class) pair of a LineCrossingCounter with the
+    attributes sv.LineZoneAnnotator reads from a sv.LineZone'''
+
+    def __init__(self, counter, line_index: int, column: int) -> None:
+        self.counter = counter
+        self.line_index = line_index
+        self.column = column
+        start, end = counter.lines[line_index]
+        self.vector = sv.Vector(start=start, end=end)
+
+    @property
+    def in_count(self) -> int:
+        return int(self.counter.in_count[self.line_index, self.column])
+
+    @property
+    def out_count(self) -> int:
+        return int(self.counter.out_count[self.line_index, self.column])
+
+
+class LineCrossingCounter:
+    '''Counts crossings of several lines by several classes per frame in a
+    single vectorized step. Every (line, class) pair and every line's
+    global counter follow the same rules as sv.LineZone.trigger: a box
+    only counts when its four corners are on the same side of the line,
+    and a tracker counts each time it changes side.'''
+
+    UNKNOWN, OUT, IN = -1, 0, 1
+
+    def __init__(self,
+                 lines: list[tuple[sv.Point, sv.Point]],
+                 class_ids: list[int]) -> None:
+        self.lines = lines
+        self.class_ids = list(class_ids)
+        # The last column holds the global counter of each line
+        self.global_column = len(self.class_ids)
+        self.starts = np.array([[s.x, s.y] for s, _ in lines])
+        self.directions = np.array([[e.x - s.x, e.y - s.y] for s, e in lines])
+        shape = (len(lines), len(self.class_ids) + 1)
+        self.in_count = np.zeros(shape, dtype=int)
+        self.out_count = np.zeros(shape, dtype=int)
+        self.tracker_state = np.full(shape + (64,), self.UNKNOWN, dtype=np.int8)
+        self.class_columns = np.full(max(self.class_ids, default=0) + 1,
+                                     -1,
+                                     dtype=int)
+        self.class_columns[self.class_ids] = np.arange(len(self.class_ids))
+
+    def get_view(self, line_index: int, class_id: int = None):
+        column = self.global_column
+        if class_id is not None:
+            column = self.class_ids.index(class_id)
+        return LineCounterView(self, line_index, column)
+
+    def get_state(self, line_index: int):
+        return (self.in_count[line_index].copy(),
+                self.out_count[line_index].copy(),
+                self.tracker_state[line_index].copy())
+
+    def set_state(self, line_index: int, state: tuple):
+        in_count, out_count, tracker_state = state
+        capacity = tracker_state.shape[-1]
+        self.ensure_capacity(capacity)
+        self.in_count[line_index] = in_count
+        self.out_count[line_index] = out_count
+        self.tracker_state[line_index, :, :capacity] = tracker_state
+
+    def trigger(self, detections: sv.Detections):
+        if detections.tracker_id is None or len(detections) == 0:
+            return
+        tracker_id = detections.tracker_id.astype(int)
+        if (tracker_id < 0).any() or \
+                len(np.unique(tracker_id)) != len(tracker_id):
+            # Same tracker twice in a frame depends on update order
+            for index in range(len(detections)):
+                self.update(detections.xyxy[index:index + 1],
+                            detections.class_id[index:index + 1],
+                            tracker_id[index:index + 1])
+            return
+        self.update(detections.xyxy, detections.class_id, tracker_id)
+
+    def get_sides(self, xyxy: np.ndarray):
+        # Same dtype as the boxes so the cross product matches sv.Vector.is_in
+        dtype = xyxy.dtype
+        x1, y1, x2, y2 = xyxy.T
+        anchors = np.stack([np.stack([x1, y1], axis=-1),
+                            np.stack([x1, y2], axis=-1),
+                            np.stack([x2, y1], axis=-1),
+                            np.stack([x2, y2], axis=-1)], axis=1)
+        starts = self.starts.astype(dtype)[:, None, None, :]
+        directions = self.directions.astype(dtype)[:, None, None, :]
+        relative = anchors[None] - starts
+        cross = directions[..., 0] * relative[..., 1] \
+            - directions[..., 1] * relative[..., 0]
+        is_in = cross < 0
+        is_valid = is_in.all(axis=-1) | ~is_in.any(axis=-1)
+        return is_in[..., 0], is_valid
+
+    def update(self, xyxy, class_id, tracker_id):
+        if tracker_id.min() < 0:
+            return
+        self.ensure_capacity(tracker_id.max() + 1)
+        is_in, is_valid = self.get_sides(xyxy)
+        sides = np.where(is_in, self.IN, self.OUT).astype(np.int8)
+        lines = np.arange(len(self.lines))[:, None]
+
+        class_column = np.full(len(class_id), -1)
+        known = (class_id >= 0) & (class_id < len(self.class_columns))
+        class_column[known] = self.class_columns[class_id[known]]
+        columns = [(class_column >= 0, class_column),
+                   (np.ones(len(class_id), dtype=bool),
+                    np.full(len(class_id), self.global_column))]
+        for has_column, column in columns:
+            valid = is_valid & has_column[None, :]
+            column = np.where(has_column, column, 0)[None, :]
+            ids = tracker_id[None, :]
+            previous = self.tracker_state[lines, column, ids]
+            crossed = valid & (previous != self.UNKNOWN) & (previous != sides)
+            crossed_in = crossed & (sides == self.IN)
+            crossed_out = crossed & (sides == self.OUT)
+            line_index, detection_index = np.nonzero(crossed_in)
+            np.add.at(self.in_count,
+                      (line_index, column[0, detection_index]), 1)
+            line_index, detection_index = np.nonzero(crossed_out)
+            np.add.at(self.out_count,
+                      (line_index, column[0, detection_index]), 1)
+            self.tracker_state[lines, column, ids] = np.where(valid,
+                                                              sides,
+                                                              previous)
+
+    def ensure_capacity(self, size: int):
+        capacity = self.tracker_state.shape[-1]
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+        grown = np.full(self.tracker_state.shape[:-1] + (new_capacity,),
+                        self.UNKNOWN,
+                        dtype=np.int8)
+        grown[..., :capacity] = self.tracker_state
+        self.tracker_state = grown
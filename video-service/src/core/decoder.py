@@ -0,0 +1,177 @@
+import queue
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator
+import av
+import cv2
+import numpy as np
+from settings import settings
+
+
+_END_OF_STREAM = object()
+
+
+class FrameDecoder(ABC):
+    '''Decodes frames in a background thread into a bounded read-ahead
+    queue. Iterating yields (frame_index, frame) tuples in BGR format,
+    where frame_index is the position of the frame in the source video.
+    Decoding seeks to start_frame when given and stops before end_frame.'''
+
+    def __init__(self,
+                 source: str,
+                 read_ahead: int = 64,
+                 target_dimensions: tuple[int, int] = None,
+                 frame_filter: Callable[[int], bool] = None,
+                 start_frame: int = 0,
+                 end_frame: int = None) -> None:
+        self.source = source
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.target_dimensions = target_dimensions
+        self.frame_filter = frame_filter
+        self._frames = queue.Queue(maxsize=max(read_ahead, 1))
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __iter__(self) -> Iterator[tuple[int, np.ndarray]]:
+        if self._thread is None:
+            self.start()
+        while True:
+            item = self._frames.get()
+            if item is _END_OF_STREAM:
+                break
+            yield item
+        if self._error:
+            raise self._error
+
+    def start(self):
+        self._thread = threading.Thread(target=self._fill_queue, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is None:
+            return
+        # Drain the queue so a producer blocked on put can exit
+        while self._thread.is_alive():
+            try:
+                self._frames.get_nowait()
+            except queue.Empty:
+                self._thread.join(timeout=0.1)
+
+    def keep_frame(self, index: int) -> bool:
+        return self.frame_filter is None or self.frame_filter(index)
+
+    def is_past_end(self, index: int) -> bool:
+        return self.end_frame is not None and index >= self.end_frame
+
+    def _fill_queue(self):
+        try:
+            for item in self.decode():
+                if self._stop_event.is_set():
+                    break
+                self._put(item)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(_END_OF_STREAM)
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self._frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    @abstractmethod
+    def decode(self) -> Iterator[tuple[int, np.ndarray]]:
+        pass
+
+
+class OpenCVDecoder(FrameDecoder):
+    def decode(self):
+        vidcap = cv2.VideoCapture(self.source)
+        if not vidcap.isOpened():
+            raise ValueError(f'Could not open video {self.source}')
+        index = self.start_frame - 1
+        if self.start_frame:
+            vidcap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+        try:
+            while vidcap.grab():
+                index += 1
+                if self.is_past_end(index):
+                    break
+                # Skipped frames are grabbed but never converted to BGR
+                if not self.keep_frame(index):
+                    continue
+                success, frame = vidcap.retrieve()
+                if not success:
+                    break
+                if self.target_dimensions:
+                    frame = cv2.resize(frame, self.target_dimensions)
+                yield index, frame
+        finally:
+            vidcap.release()
+
+
+class PyAVDecoder(FrameDecoder):
+    THREADS = settings.DECODER_THREADS
+
+    def decode(self):
+        with av.open(self.source) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = 'AUTO'
+            stream.thread_count = self.THREADS
+            for index, frame in self.iter_indexed_frames(container, stream):
+                if self.is_past_end(index):
+                    break
+                if not self.keep_frame(index):
+                    continue
+                # Scale and convert to BGR in a single swscale call
+                width, height = self.target_dimensions or (frame.width,
+                                                           frame.height)
+                yield index, frame.to_ndarray(width=width,
+                                              height=height,
+                                              format='bgr24')
+
+    def iter_indexed_frames(self, container, stream):
+        if not self.start_frame:
+            yield from enumerate(container.decode(stream))
+            return
+        # Seek to the keyframe before the start frame and index decoded
+        # frames by timestamp, optimized videos have a constant frame rate
+        start_time = stream.start_time or 0
+        rate = stream.average_rate
+        offset = int(self.start_frame / rate / stream.time_base)
+        container.seek(start_time + offset, stream=stream)
+        for frame in container.decode(stream):
+            if frame.pts is None:
+                continue
+            index = round((frame.pts - start_time) * stream.time_base * rate)
+            if index >= self.start_frame:
+                yield index, frame
+
+
+class DecoderFactory:
+    @staticmethod
+    def get_decoder(source: str,
+                    backend: str = settings.DECODER_BACKEND,
+                    **kwargs) -> FrameDecoder:
+        catalog = {
+            'OPENCV': OpenCVDecoder,
+            'PYAV': PyAVDecoder
+        }
+        decoder_class = catalog.get(backend.upper(), None)
+        if not decoder_class:
+            raise KeyError('Requested decoder backend is not available')
+        kwargs.setdefault('read_ahead', settings.DECODER_READ_AHEAD)
+        return decoder_class(source, **kwargs)
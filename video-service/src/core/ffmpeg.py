@@ -0,0 +1,224 @@
+import os
+import json
+import subprocess
+from fractions import Fraction
+from typing import Callable
+
+
+def run_ffmpeg(args: list[str],
+               on_progress: Callable[[int, float], None] = None):
+    command = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', *args]
+    if on_progress is None:
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f'ffmpeg failed: {completed.stderr.strip()}')
+        return
+
+    # Progress comes as key=value lines on stdout, each block closed by a
+    # progress= line. Only errors are logged, so stderr stays small.
+    command[1:1] = ['-progress', 'pipe:1', '-nostats']
+    frame, fps = 0, 0.0
+    with subprocess.Popen(command,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          text=True) as process:
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key == 'frame':
+                frame = int(value)
+            elif key == 'fps':
+                fps = parse_float(value)
+            elif key == 'progress':
+                on_progress(frame, fps)
+        stderr = process.stderr.read()
+    if process.returncode != 0:
+        raise RuntimeError(f'ffmpeg failed: {stderr.strip()}')
+
+
+def parse_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def probe_video(source: str) -> dict:
+    # Reads the container header only (moov atom over ranged HTTP reads),
+    # frames are never decoded nor counted
+    entries = ('stream=codec_name,pix_fmt,width,height,avg_frame_rate,'
+               'nb_frames,duration:format=format_name,duration')
+    command = ['ffprobe', '-v', 'error',
+               '-select_streams', 'v:0',
+               '-show_entries', entries,
+               '-of', 'json', source]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'ffprobe failed: {completed.stderr.strip()}')
+
+    probe = json.loads(completed.stdout)
+    if not probe.get('streams'):
+        raise RuntimeError('ffprobe found no video stream')
+    stream = probe['streams'][0]
+    container = probe.get('format', {})
+    frame_rate = stream.get('avg_frame_rate', '0/1')
+    frame_rate = Fraction(frame_rate) if frame_rate != '0/0' else Fraction(0)
+    fps = float(frame_rate)
+    duration = float(stream.get('duration') or container.get('duration') or 0)
+    total_frames = int(stream.get('nb_frames') or round(duration * fps))
+    return {
+        'container': container.get('format_name', ''),
+        'codec': stream.get('codec_name'),
+        'pix_fmt': stream.get('pix_fmt'),
+        'width': stream.get('width'),
+        'height': stream.get('height'),
+        'fps': fps,
+        'frame_rate': frame_rate,
+        'total_frames': total_frames,
+        'duration': duration,
+    }
+
+
+def find_keyframe_time(source: str, timestamp: float) -> float | None:
+    # Seek to the timestamp and read a single packet, no full scan needed
+    command = ['ffprobe', '-v', 'error',
+               '-select_streams', 'v:0',
+               '-read_intervals', f'{timestamp:.6f}%+#1',
+               '-show_entries', 'packet=pts_time,flags',
+               '-of', 'json', source]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'ffprobe failed: {completed.stderr.strip()}')
+
+    packets = json.loads(completed.stdout).get('packets', [])
+    for packet in packets:
+        if 'K' in packet.get('flags', '') and 'pts_time' in packet:
+            return float(packet['pts_time'])
+
+
+def concat_mp4(segment_paths: list[str], target_path: str):
+    list_path = f'{target_path}.txt'
+    with open(list_path, 'w') as segment_list:
+        for path in segment_paths:
+            segment_list.write(f"file '{path}'\n")
+    args = ['-f', 'concat',
+            '-safe', '0',
+            '-i', list_path,
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            '-f', 'mp4',
+            target_path]
+    try:
+        run_ffmpeg(args)
+    finally:
+        os.remove(list_path)
+
+
+def remux_mp4(source: str, target_path: str):
+    args = ['-i', source,
+            '-map', '0:v:0',
+            '-an',
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            '-f', 'mp4',
+            target_path]
+    run_ffmpeg(args)
+
+
+def get_even_dimensions(dimensions: tuple[int, int]) -> tuple[int, int]:
+    # libx264 with yuv420p only accepts even width and height
+    width, height = dimensions
+    return width - width % 2, height - height % 2
+
+
+def build_filter_graph(target_dimensions: tuple[int, int] = None,
+                       fps: int = None) -> str | None:
+    filters = []
+    # Drop frames before scaling so fewer frames go through the scaler
+    if fps:
+        filters.append(f'fps={fps}')
+    if target_dimensions:
+        width, height = get_even_dimensions(target_dimensions)
+        filters.append(f'scale={width}:{height}')
+    return ','.join(filters) or None
+
+
+def build_decimation_filter(fps: int,
+                            input_fps: float,
+                            offset: float = 0.0) -> str:
+    # Keeps the first frame of every 1/fps slot of the source timeline. The
+    # rule only depends on source timestamps (t is shifted by the segment
+    # offset), so segments encoded apart keep the frames a single fps
+    # filter pass would, then get contiguous timestamps again.
+    slot = f'floor(({{}}+{offset:.6f})*{fps}+1e-6)'
+    previous = f'if(isnan(prev_pts),t-{1 / input_fps:.9f},prev_pts*TB)'
+    return (f"select='gt({slot.format('t')},{slot.format(previous)})',"
+            f'setpts=N/({fps}*TB)')
+
+
+def encode_h264(source: str,
+                target_path: str,
+                filter_graph: str = None,
+                preset: str = 'medium',
+                input_args: list[str] = None,
+                output_args: list[str] = None,
+                on_progress: Callable[[int, float], None] = None):
+    args = [*(input_args or []), '-i', source]
+    if filter_graph:
+        args += ['-vf', filter_graph]
+    args += ['-an',
+             '-c:v', 'libx264',
+             '-preset', preset,
+             '-pix_fmt', 'yuv420p',
+             *(output_args or []),
+             '-movflags', '+faststart',
+             '-f', 'mp4',
+             target_path]
+    run_ffmpeg(args, on_progress)
+
+
+class FrameWriter:
+    '''Pipes raw BGR frames into a single ffmpeg H.264 encoder process'''
+
+    def __init__(self,
+                 target_path: str,
+                 dimensions: tuple[int, int],
+                 fps: Fraction | float,
+                 preset: str = 'medium') -> None:
+        self.target_path = target_path
+        self.dimensions = dimensions
+        self.fps = fps
+        self.preset = preset
+        self.process = None
+
+    def __enter__(self):
+        width, height = self.dimensions
+        command = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+                   '-f', 'rawvideo',
+                   '-pix_fmt', 'bgr24',
+                   '-s', f'{width}x{height}',
+                   '-r', str(self.fps),
+                   '-i', '-',
+                   '-an',
+                   '-c:v', 'libx264',
+                   '-preset', self.preset,
+                   '-pix_fmt', 'yuv420p',
+                   '-movflags', '+faststart',
+                   '-f', 'mp4',
+                   self.target_path]
+        self.process = subprocess.Popen(command,
+                                        stdin=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        return self
+
+    def write_frame(self, frame):
+        self.process.stdin.write(frame.tobytes())
+
+    def __exit__(self, *args):
+        _, stderr = self.process.communicate()
+        if self.process.returncode != 0:
+            raise RuntimeError(f'ffmpeg failed: {stderr.decode().strip()}')
+
+
+def transcode_to_h264(source: str, target_path: str):
+    args = ['-i', source, '-vcodec', 'libx264', '-f', 'mp4', target_path]
+    run_ffmpeg(args)
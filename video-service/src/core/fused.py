@@ -0,0 +1,126 @@
+import os
+import logging
+from contextlib import ExitStack
+from supervision.utils.video import VideoInfo, VideoSink
+from settings import settings
+from core.ffmpeg import FrameWriter, get_even_dimensions
+from core.optimizer import VideoOptimizer
+from core.predictor import VideoPredictor
+from core.tracks import TrackRecorder
+from core.tracking import FrameTracker
+from core.batch import (get_measurements_output_paths,
+                        save_measurements_outputs,
+                        share_line_counter,
+                        share_timer,
+                        get_shared_roi,
+                        get_motion_regions,
+                        process_measurements_frame,
+                        update_measurements_progress)
+
+
+logger = logging.getLogger(__name__)
+
+
+class FusedVideoProcessor:
+    '''Optimizes a video and predicts its pending measurements while
+    decoding the input a single time'''
+
+    def __init__(self, video_id: int, measurement_ids: list[int]) -> None:
+        self.optimizer = VideoOptimizer(video_id)
+        self.measurement_ids = measurement_ids
+
+    def process(self):
+        optimizer = self.optimizer
+        video = optimizer.video
+        processor, kwargs = optimizer.get_processor_and_args(
+            optimizer.get_input_video_info())
+        fps_factor = kwargs.get('fps_factor')
+        input_dimensions = (video.width, video.height)
+        dimensions = get_even_dimensions(kwargs.get('target_dimensions',
+                                                    input_dimensions))
+        # Frames are counted after the fps trim, like the optimized video
+        output_info = VideoInfo(
+            width=dimensions[0],
+            height=dimensions[1],
+            fps=kwargs['video_info'].fps,
+            total_frames=optimizer.get_output_frame_count(fps_factor))
+        predictors = [VideoPredictor(measurement_id, video_info=output_info)
+                      for measurement_id in self.measurement_ids]
+        share_timer(predictors, optimizer.timer)
+        output_paths = get_measurements_output_paths(predictors)
+
+        target_s3_key, target_path = optimizer.get_target_paths()
+        # Compliant inputs are still remuxed, frames only feed the predictors
+        encode_frames = processor != optimizer.remux_video
+        if not encode_frames:
+            with optimizer.timer.stage('remux'):
+                processor(target_path, **kwargs)
+
+        decoder_kwargs = {}
+        if dimensions != input_dimensions:
+            decoder_kwargs['target_dimensions'] = dimensions
+        if fps_factor:
+            decoder_kwargs['frame_filter'] = optimizer.get_fps_filter(fps_factor)
+        decoder = optimizer.get_decoder(**decoder_kwargs)
+
+        logger.info(f'Fused optimization of video {video.id} with '
+                    f'measurements {self.measurement_ids}')
+        with ExitStack() as stack:
+            writer = None
+            if encode_frames:
+                writer = stack.enter_context(
+                    FrameWriter(target_path,
+                                dimensions,
+                                optimizer.get_output_frame_rate(fps_factor),
+                                preset=settings.FFMPEG_PRESET))
+            sinks = [stack.enter_context(VideoSink(paths[1], output_info))
+                     if paths else None
+                     for paths in output_paths]
+            stack.enter_context(decoder)
+            self.process_frames(decoder, writer, predictors, sinks)
+
+        is_valid_in_filesystem = os.path.isfile(target_path)
+        if not is_valid_in_filesystem:
+            raise ValueError('Target path is not a valid path')
+
+        optimizer.save_optimized_video(target_path,
+                                       target_s3_key,
+                                       fps_factor or 1)
+        optimizer.save_timing()
+        save_measurements_outputs(predictors, output_paths)
+
+    def process_frames(self, decoder, writer, predictors, sinks):
+        # Every predictor runs in this thread and shares one model instance
+        lead = predictors[0]
+        recorder = TrackRecorder()
+        lead.roi = get_shared_roi(predictors)
+        lead.motion_regions = get_motion_regions(predictors)
+        timer = self.optimizer.timer
+        tracker = FrameTracker(lead.model,
+                               roi=lead.roi,
+                               motion_gate=lead.get_motion_gate(),
+                               timer=timer)
+        line_counter = share_line_counter(predictors)
+
+        def iter_frames():
+            # Indexed by output frame, matching the optimized video
+            frames = timer.time_iter('decode', decoder)
+            for index, (input_index, frame) in enumerate(frames):
+                if writer:
+                    with timer.stage('encode', 1):
+                        writer.write_frame(frame)
+                self.optimizer.progress.update(input_index + 1)
+                yield index, frame
+
+        for index, frame, result in tracker.iter_tracked(iter_frames()):
+            tracked = lead.get_tracked_detections(result)
+            recorder.add(index, tracked)
+            detections = lead.filter_detections(tracked)
+            process_measurements_frame(predictors,
+                                       sinks,
+                                       line_counter,
+                                       frame,
+                                       detections)
+            update_measurements_progress(predictors, index + 1)
+        if lead.TRACK_STORE and tracker.is_full_inference:
+            lead.track_store.save(self.optimizer.video.id, recorder)
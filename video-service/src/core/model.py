@@ -1,10 +1,99 @@
+import os
+import json
+import shutil
+import logging
+import threading
+from functools import lru_cache
+from pathlib import Path
 from ultralytics import YOLO
 from settings import settings
 
 
-def initialize_model(model_name):
-    model = YOLO(model_name)
-    model.fuse()
-    return model
+logger = logging.getLogger(__name__)
 
-model = initialize_model(settings.MODEL_NAME)
+_thread_models = threading.local()
+_export_lock = threading.Lock()
+
+EXPORT_SUFFIXES = {'onnx': '.onnx', 'openvino': '_openvino_model'}
+
+
+def get_export_path(model_name: str, backend: str, precision: str = 'fp32'):
+    stem = Path(model_name).stem
+    if precision != 'fp32':
+        stem = f'{stem}-{precision}'
+    return os.path.join(settings.MODEL_EXPORT_DIR,
+                        f'{stem}{EXPORT_SUFFIXES[backend]}')
+
+
+def get_gate_report_path(model_path: str):
+    return f'{model_path}.gate.json'
+
+
+def export_model(model_name: str, backend: str):
+    # Exported once per backend, later loads reuse the cached artifact
+    export_path = get_export_path(model_name, backend)
+    with _export_lock:
+        if os.path.exists(export_path):
+            return export_path
+        logger.info(f'Exporting {model_name} to {backend}')
+        os.makedirs(settings.MODEL_EXPORT_DIR, exist_ok=True)
+        # Dynamic axes so batched inference keeps working
+        exported = YOLO(model_name).export(format=backend, dynamic=True)
+        shutil.move(exported, export_path)
+    return export_path
+
+
+def load_quantized_model(model_name: str, backend: str):
+    # INT8 models are produced offline by core.quantization and only load
+    # once they passed its count accuracy gate
+    if backend != 'onnx':
+        raise ValueError('INT8 inference is only available for onnx')
+    path = get_export_path(model_name, backend, 'int8')
+    report_path = get_gate_report_path(path)
+    if not os.path.isfile(report_path):
+        raise RuntimeError(f'{path} has not been through the count gate')
+    with open(report_path) as file:
+        if not json.load(file)['passed']:
+            raise RuntimeError(f'{path} failed the count gate')
+    return YOLO(path, task='detect')
+
+
+def initialize_model(model_name,
+                     backend: str = 'torch',
+                     precision: str = 'fp32'):
+    if precision == 'int8':
+        return load_quantized_model(model_name, backend)
+    if backend == 'torch':
+        model = YOLO(model_name)
+        model.fuse()
+        return model
+    if backend not in EXPORT_SUFFIXES:
+        raise ValueError(f'Unsupported inference backend {backend}')
+    return YOLO(export_model(model_name, backend), task='detect')
+
+
+def get_model():
+    # Ultralytics predictors are stateful and not thread safe, so every
+    # thread running inference gets its own instance
+    if not hasattr(_thread_models, 'model'):
+        _thread_models.model = initialize_model(settings.MODEL_NAME,
+                                                settings.INFERENCE_BACKEND,
+                                                settings.INFERENCE_PRECISION)
+    return _thread_models.model
+
+
+@lru_cache
+def get_class_names() -> dict:
+    # Exported models only expose their names once a predictor is set up,
+    # the PyTorch checkpoint carries the same ones
+    return YOLO(settings.MODEL_NAME).names
+
+
+def get_model_key():
+    # Identifies the inference setup that produced stored tracks
+    key = Path(settings.MODEL_NAME).stem
+    if settings.INFERENCE_BACKEND != 'torch':
+        key = f'{key}-{settings.INFERENCE_BACKEND}'
+    if settings.INFERENCE_PRECISION != 'fp32':
+        key = f'{key}-{settings.INFERENCE_PRECISION}'
+    return key
@@ -0,0 +1,66 @@
+import math
+import logging
+import cv2
+import numpy as np
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class MotionGate:
+    '''Decides which frames need inference by differencing downscaled
+    grayscale frames inside the regions around the counting lines. Frames
+    are compared against the last frame that went through inference, and
+    one in every MAX_SKIP + 1 frames is always inferred.'''
+
+    WIDTH = settings.MOTION_GATE_WIDTH
+    THRESHOLD = settings.MOTION_GATE_THRESHOLD
+    MAX_SKIP = settings.MOTION_GATE_MAX_SKIP
+    PIXEL_DELTA = 25
+
+    def __init__(self,
+                 regions: list[tuple[int, int, int, int]],
+                 frame_size: tuple[int, int]) -> None:
+        width, height = frame_size
+        self.scale = min(self.WIDTH / width, 1)
+        self.size = (max(round(width * self.scale), 1),
+                     max(round(height * self.scale), 1))
+        self.mask = np.zeros(self.size[::-1], dtype=bool)
+        for x1, y1, x2, y2 in regions:
+            self.mask[int(y1 * self.scale):math.ceil(y2 * self.scale),
+                      int(x1 * self.scale):math.ceil(x2 * self.scale)] = True
+        self.area = max(np.count_nonzero(self.mask), 1)
+        self.reference = None
+        self.skipped = 0
+        self.frames = 0
+        self.skipped_frames = 0
+
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        image = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(image, (5, 5), 0)
+
+    def has_motion(self, image: np.ndarray) -> bool:
+        delta = cv2.absdiff(image, self.reference) > self.PIXEL_DELTA
+        changed = np.count_nonzero(delta & self.mask)
+        return changed > self.THRESHOLD * self.area
+
+    def needs_inference(self, frame: np.ndarray) -> bool:
+        image = self.prepare(frame)
+        self.frames += 1
+        if self.reference is None or self.skipped >= self.MAX_SKIP \
+                or self.has_motion(image):
+            self.reference = image
+            self.skipped = 0
+            return True
+        self.skipped += 1
+        self.skipped_frames += 1
+        return False
+
+    def log_skipped(self):
+        if not self.frames:
+            return
+        ratio = self.skipped_frames / self.frames
+        logger.info(f'Motion gate skipped {self.skipped_frames} of '
+                    f'{self.frames} frames ({ratio:.0%})')
@@ -1,9 +1,18 @@
 import os
 import logging
-import cv2
+import threading
+from fractions import Fraction
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from supervision.utils.video import VideoInfo, VideoSink
 from settings import settings
+from core.decoder import DecoderFactory
+from core.ffmpeg import (build_filter_graph, build_decimation_filter,
+                         encode_h264, transcode_to_h264, probe_video,
+                         remux_mp4, find_keyframe_time, concat_mp4)
 from shared.service.videos import VideoManager
+from shared.queue.progress import ProgressPublisher
+from core.timing import StageTimer
 from shared.schemas.videos import (VideoSchema,
                                    UpdateVideoInternal)
 
@@ -14,8 +23,15 @@ logger = logging.getLogger(__name__)
 class VideoOptimizer:
     MAX_FPS = settings.MAX_FPS
     MAX_BASE_DIMENSION = settings.MAX_BASE_DIMENSION
+    ENGINE = settings.OPTIMIZER_ENGINE
+    SEGMENTS = settings.OPTIMIZER_SEGMENTS
+    MIN_SEGMENT_DURATION = settings.OPTIMIZER_MIN_SEGMENT_DURATION
+    STREAM_COPY_CODECS = ['h264']
+    STREAM_COPY_CONTAINERS = ['mp4', 'mov']
+    STREAM_COPY_PIXEL_FORMATS = ['yuv420p', 'yuvj420p']
 
     def __init__(self, video_id: int) -> None:
+        self.timer = StageTimer()
         self.manager = VideoManager('internal')
         if not isinstance(video_id, int):
             raise TypeError('Video ID should be integer')
@@ -26,38 +42,213 @@ class VideoOptimizer:
             raise ValueError('Video path is not valid')
 
         self.save_metadata(self.video.input_video_url)
+        self.progress = ProgressPublisher('video',
+                                          self.video.id,
+                                          self.video.total_frames)
+        self.progress.set_status(self.video.status)
 
     def save_metadata(self, video_path):
-        metadata = self.get_video_metadata(video_path)
-        self.video = self.manager.update_video(video_id=self.video.id,
-                                               params=metadata)
+        with self.timer.stage('probe'):
+            metadata = self.get_video_metadata(video_path)
+        with self.timer.stage('database'):
+            self.video = self.manager.update_video(video_id=self.video.id,
+                                                   params=metadata)
 
     def get_video_metadata(self, video_path):
         try:
-            info = VideoInfo.from_video_path(video_path)
-            duration = int(info.total_frames/info.fps)
+            self.probe = probe_video(video_path)
+            fps = int(self.probe['fps'])
+            total_frames = self.probe['total_frames']
+            duration = int(total_frames/fps)
             metadata = UpdateVideoInternal(status='PREPROCESSING',
-                                           width=info.width,
-                                           height=info.height,
-                                           fps=info.fps,
-                                           total_frames=info.total_frames,
+                                           width=self.probe['width'],
+                                           height=self.probe['height'],
+                                           fps=fps,
+                                           total_frames=total_frames,
                                            duration=duration)
             return metadata
         except:
             raise RuntimeError('Video metadata could not be extracted')
 
+    def get_optimized_metadata(self, target_path):
+        # Local file, so probing it costs no network round trips
+        probe = probe_video(target_path)
+        return {
+            'optimized_width': probe['width'],
+            'optimized_height': probe['height'],
+            'optimized_fps': int(probe['fps']),
+            'optimized_total_frames': probe['total_frames'],
+        }
+
     def optimize(self):
-        video_info = VideoInfo(width=self.video.width,
-                               height=self.video.height,
-                               fps=self.video.fps,
-                               total_frames=self.video.total_frames)
+        video_info = self.get_input_video_info()
+        target_s3_key, target_path = self.get_target_paths()
+
+        processor, kwargs = self.get_processor_and_args(video_info)
+        if processor == self.remux_video:
+            with self.timer.stage('remux'):
+                processor(target_path, **kwargs)
+        elif self.ENGINE == 'ffmpeg':
+            # Decode, resize and encode all happen inside ffmpeg
+            with self.timer.stage('ffmpeg'):
+                self.ffmpeg_optimize(target_path, **kwargs)
+        else:
+            self.opencv_optimize(target_path, processor, kwargs)
+
+        is_valid_in_filesystem = os.path.isfile(target_path)
+        if not is_valid_in_filesystem:
+            raise ValueError('Target path is not a valid path')
+
+        fps_factor = kwargs.get('fps_factor', 1)
+        self.save_optimized_video(target_path, target_s3_key, fps_factor)
+        self.save_timing()
+
+    def save_timing(self):
+        self.timer.save(self.manager,
+                        'optimization',
+                        self.video.id,
+                        frames=self.video.optimized_total_frames or 0)
+
+    def save_optimized_video(self, target_path, target_s3_key, fps_factor):
+        with self.timer.stage('probe'):
+            optimized_metadata = self.get_optimized_metadata(target_path)
+        with self.timer.stage('upload'):
+            self.manager.s3.upload_video_file(target_path, target_s3_key)
+        os.remove(target_path)
+        added_metadata = UpdateVideoInternal(status='OPTIMIZED',
+                                             optimized_s3_key=target_s3_key,
+                                             optimized_fps_ratio=fps_factor,
+                                             **optimized_metadata)
+        with self.timer.stage('database'):
+            self.video = self.manager.update_video(video_id=self.video.id,
+                                                   params=added_metadata)
+        self.progress.set_status(self.video.status)
+
+    def get_input_video_info(self):
+        return VideoInfo(width=self.video.width,
+                         height=self.video.height,
+                         fps=self.video.fps,
+                         total_frames=self.video.total_frames)
+
+    def get_target_paths(self):
         target_s3_key = self.manager.generate_video_key('optimized')
         local_filename = target_s3_key.split("/")[-1]
-        # _target_path is raw mp4, target_path is the file for web codec 
-        _target_path = os.path.join(os.getcwd(), f'_{local_filename}')
         target_path = os.path.join(os.getcwd(), local_filename)
+        return target_s3_key, target_path
 
-        processor, kwargs = self.get_processor_and_args(video_info)
+    def ffmpeg_optimize(self,
+                        target_path,
+                        video_info,
+                        target_dimensions=None,
+                        fps_factor=None):
+        # Single ffmpeg process: decode, fps trim, rescale and H.264 encode
+        fps = video_info.fps if fps_factor else None
+        boundaries = self.get_segment_boundaries()
+        on_progress = self.get_ffmpeg_progress(len(boundaries), fps_factor)
+        if len(boundaries) > 1:
+            self.segmented_ffmpeg_optimize(target_path,
+                                           boundaries,
+                                           target_dimensions,
+                                           fps,
+                                           on_progress)
+            return
+        encode_h264(self.video.input_video_url,
+                    target_path,
+                    filter_graph=build_filter_graph(target_dimensions, fps),
+                    preset=settings.FFMPEG_PRESET,
+                    on_progress=partial(on_progress, 0))
+
+    def get_ffmpeg_progress(self, segments, fps_factor=None):
+        # Segments encode in parallel, their latest frame counts and rates
+        # add up. ffmpeg counts output frames, progress counts input ones.
+        scale = 1 / fps_factor if fps_factor else 1
+        frames = [0] * segments
+        rates = [0.0] * segments
+        lock = threading.Lock()
+
+        def on_progress(index, frame, fps):
+            with lock:
+                frames[index] = frame
+                rates[index] = fps
+                self.progress.update(int(sum(frames) * scale),
+                                     fps=sum(rates) * scale)
+
+        return on_progress
+
+    def get_segment_boundaries(self):
+        duration = self.video.total_frames / self.video.fps
+        segments = min(self.SEGMENTS,
+                       int(duration // max(self.MIN_SEGMENT_DURATION, 1)))
+        if segments <= 1:
+            return [0.0]
+
+        # Segments must start at keyframes so they can be cut exactly
+        boundaries = [0.0]
+        for index in range(1, segments):
+            target = duration * index / segments
+            keyframe = find_keyframe_time(self.video.input_video_url, target)
+            if keyframe and keyframe > boundaries[-1]:
+                boundaries.append(keyframe)
+        return boundaries
+
+    def segmented_ffmpeg_optimize(self,
+                                  target_path,
+                                  boundaries,
+                                  target_dimensions=None,
+                                  fps=None,
+                                  on_progress=None):
+        # Each segment is encoded by its own ffmpeg process. Cuts sit half a
+        # frame before each keyframe so rounding never drops a frame.
+        half_frame = 0.5 / self.video.fps
+        cuts = [0.0] + [max(b - half_frame, 0.0) for b in boundaries[1:]]
+        # An fps filter per segment would restart its frame grid at every
+        # cut, segments are decimated on the source timeline instead
+        input_fps = probe_video(self.video.input_video_url)['fps'] \
+            if fps else None
+        threads = max((os.cpu_count() or 1) // len(cuts), 1)
+        directory, filename = os.path.split(target_path)
+        segment_paths = []
+        futures = []
+        with ThreadPoolExecutor(max_workers=len(cuts)) as executor:
+            for index, start in enumerate(cuts):
+                segment_path = os.path.join(directory, f'_{index}_{filename}')
+                filters = [build_decimation_filter(fps, input_fps, start)] \
+                    if fps else []
+                scale = build_filter_graph(target_dimensions)
+                if scale:
+                    filters.append(scale)
+                input_args = ['-ss', f'{start:.6f}'] if start else []
+                # Limits the source read, output timestamps are re-timed
+                if index + 1 < len(cuts):
+                    input_args += ['-t', f'{cuts[index + 1] - start:.6f}']
+                output_args = ['-threads', str(threads)]
+                if fps:
+                    output_args += ['-r', str(fps)]
+                segment_paths.append(segment_path)
+                futures.append(executor.submit(encode_h264,
+                                               self.video.input_video_url,
+                                               segment_path,
+                                               filter_graph=','.join(filters)
+                                               or None,
+                                               preset=settings.FFMPEG_PRESET,
+                                               input_args=input_args,
+                                               output_args=output_args,
+                                               on_progress=partial(
+                                                   on_progress, index)
+                                               if on_progress else None))
+        try:
+            for future in futures:
+                future.result()
+            concat_mp4(segment_paths, target_path)
+        finally:
+            for segment_path in segment_paths:
+                if os.path.isfile(segment_path):
+                    os.remove(segment_path)
+
+    def opencv_optimize(self, target_path, processor, kwargs):
+        # _target_path is raw mp4, target_path is the file for web codec
+        directory, filename = os.path.split(target_path)
+        _target_path = os.path.join(directory, f'_{filename}')
         processor(_target_path, **kwargs)
 
         is_valid_in_filesystem = os.path.isfile(_target_path)
@@ -65,16 +256,9 @@ class VideoOptimizer:
             raise ValueError('Target path is not a valid path')
 
         # Use ffmpeg to change codecs
-        os.system(f"ffmpeg -y -i {_target_path} -vcodec libx264 -f mp4 {target_path}")
-        fps_factor = kwargs.get('fps_factor', 1)
-        self.manager.s3.upload_video_file(target_path, target_s3_key)
-        os.remove(target_path)
+        with self.timer.stage('transcode'):
+            transcode_to_h264(_target_path, target_path)
         os.remove(_target_path)
-        added_metadata = UpdateVideoInternal(status='OPTIMIZED',
-                                             optimized_s3_key=target_s3_key,
-                                             optimized_fps_ratio=fps_factor)
-        self.video = self.manager.update_video(video_id=self.video.id,
-                                               params=added_metadata)
 
     def get_processor_and_args(self, video_info: VideoInfo):
         dimensions = (video_info.width, video_info.height)
@@ -126,76 +310,86 @@ class VideoOptimizer:
         kwargs = {
                 'video_info': video_info,
             }
+        if self.is_stream_copy_compliant():
+            return self.remux_video, kwargs
         return self.copy_video, kwargs
 
+    def is_stream_copy_compliant(self):
+        probe = self.probe
+        containers = probe['container'].split(',')
+        return all([probe['codec'] in self.STREAM_COPY_CODECS,
+                    any(c in self.STREAM_COPY_CONTAINERS for c in containers),
+                    probe['pix_fmt'] in self.STREAM_COPY_PIXEL_FORMATS])
+
     def get_target_dimensions(self, video_dimensions, min_side):
         crop_factor = self.MAX_BASE_DIMENSION/min_side
         new_width = int(video_dimensions[0]*crop_factor)
         new_height = int(video_dimensions[1]*crop_factor)
         return new_width, new_height
 
-    def copy_video(self, target_path, video_info):
-        vidcap = cv2.VideoCapture(self.video.input_video_url)
-        count = 0
-        success = True
-        with VideoSink(target_path, video_info) as sink:
-            while success:
-                success, frame = vidcap.read()
-                if not success: break
+    def remux_video(self, target_path, video_info):
+        # Input already meets the limits: stream copy with faststart only
+        remux_mp4(self.video.input_video_url, target_path)
+
+    def get_decoder(self, **kwargs):
+        return DecoderFactory.get_decoder(self.video.input_video_url, **kwargs)
+
+    def get_output_frame_count(self, fps_factor=None):
+        # Input frames the fps filter keeps
+        total_frames = self.video.total_frames
+        if not fps_factor or not total_frames:
+            return total_frames
+        return int((total_frames - 1) * fps_factor) + 1
+
+    def get_output_frame_rate(self, fps_factor=None):
+        # Exact rate of the kept frames, video.fps is rounded down
+        frame_rate = self.probe['frame_rate']
+        if fps_factor:
+            frame_rate *= Fraction(fps_factor).limit_denominator(1000)
+        return frame_rate
+
+    def get_fps_filter(self, fps_factor):
+        index_out = -1
+
+        def keep_frame(index_in):
+            nonlocal index_out
+            out_due = int(index_in * fps_factor)
+            if out_due > index_out:
+                index_out += 1
+                return True
+            return False
+
+        return keep_frame
+
+    def write_frames(self, sink: VideoSink, decoder):
+        for index, frame in self.timer.time_iter('decode', decoder):
+            with self.timer.stage('write', 1):
                 sink.write_frame(frame)
-                count += 1
+            self.progress.update(index + 1)
+
+    def copy_video(self, target_path, video_info):
+        with VideoSink(target_path, video_info) as sink, \
+                self.get_decoder() as decoder:
+            self.write_frames(sink, decoder)
 
     def trim_video_fps(self, target_path, video_info, fps_factor):
-        with VideoSink(target_path, video_info) as sink:
-            vidcap = cv2.VideoCapture(self.video.input_video_url)
-            assert vidcap.isOpened()
-            index_in = -1
-            index_out = -1
-
-            while True:
-                success = vidcap.grab()
-                if not success: break
-                index_in += 1
-
-                out_due = int(index_in / fps_factor)
-                if out_due > index_out:
-                    success, frame = vidcap.retrieve()
-                    if not success: break
-                    index_out += 1
-                    sink.write_frame(frame)
+        fps_filter = self.get_fps_filter(fps_factor)
+        with VideoSink(target_path, video_info) as sink, \
+                self.get_decoder(frame_filter=fps_filter) as decoder:
+            self.write_frames(sink, decoder)
 
     def rescale_video(self, target_path, video_info, target_dimensions):
-        vidcap = cv2.VideoCapture(self.video.input_video_url)
-        count = 0
-        success = True
-        with VideoSink(target_path, video_info) as sink:
-            while success:
-                success, frame = vidcap.read()
-                if not success: break
-                resized = cv2.resize(frame, target_dimensions)
-                sink.write_frame(resized)
-                count += 1
+        with VideoSink(target_path, video_info) as sink, \
+                self.get_decoder(target_dimensions=target_dimensions) as decoder:
+            self.write_frames(sink, decoder)
 
     def trim_video_fps_and_rescale(self,
                                    target_path,
                                    video_info,
                                    target_dimensions,
                                    fps_factor):
-        with VideoSink(target_path, video_info) as sink:
-            vidcap = cv2.VideoCapture(self.video.input_video_url)
-            assert vidcap.isOpened()
-            index_in = -1
-            index_out = -1
-
-            while True:
-                success = vidcap.grab()
-                if not success: break
-                index_in += 1
-
-                out_due = int(index_in / fps_factor)
-                if out_due > index_out:
-                    success, frame = vidcap.retrieve()
-                    if not success: break
-                    resized = cv2.resize(frame, target_dimensions)
-                    index_out += 1
-                    sink.write_frame(resized)
+        fps_filter = self.get_fps_filter(fps_factor)
+        with VideoSink(target_path, video_info) as sink, \
+                self.get_decoder(target_dimensions=target_dimensions,
+                                 frame_filter=fps_filter) as decoder:
+            self.write_frames(sink, decoder)
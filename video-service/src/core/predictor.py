@@ -1,11 +1,20 @@
 import os
 import logging
+from itertools import islice
 import numpy as np
 import supervision as sv
-from supervision.utils.video import VideoInfo, VideoSink
+from supervision.utils.video import VideoInfo
 from settings import settings
-from core.model import model
+from core.model import get_model, get_class_names
+from core.tracking import FrameTracker
+from core.counter import LineCrossingCounter
+from core.motion import MotionGate
+from core.ffmpeg import transcode_to_h264
+from core.decoder import DecoderFactory
+from core.tracks import TrackStore, TrackRecorder
+from core.timing import StageTimer
 from shared.service.videos import VideoManager
+from shared.queue.progress import ProgressPublisher
 from shared.schemas.videos import VideoSchema
 from shared.schemas.measurements import (MeasurementSchema,
                                          UpdateMeasurementInternal,
@@ -18,32 +27,79 @@ logger = logging.getLogger(__name__)
 class VideoPredictor:
     ALLOWED_CLASS_ID = settings.ALLOWED_CLASS_ID
     CONFIDENCE_THRESHOLD = settings.CONFIDENCE_THRESHOLD
+    TRACK_STORE = settings.TRACK_STORE
+    ROI_PADDING = settings.ROI_PADDING
+    MOTION_GATE = settings.MOTION_GATE
 
-    def __init__(self, measurement_id: int) -> None:
+    def __init__(self,
+                 measurement_id: int,
+                 video_info: VideoInfo = None) -> None:
+        self.timer = StageTimer()
+        self.processed_frames = 0
+        # Set when resuming from a checkpoint
+        self.start_frame = 0
+        self.tracker_state = None
+        self.tracker = None
+        self.tracks = None
+        self.tracks_loaded = False
         self.manager = VideoManager('internal')
         if not isinstance(measurement_id, int):
             raise TypeError('Measurement ID should be integer')
 
+        self.model = get_model()
+        self.track_store = TrackStore(self.manager.s3)
         self.measurement: MeasurementSchema = self.manager.get_measurement(measurement_id)
-        self._get_video_metadata()
+        self._get_video_metadata(video_info)
         self._instantiate_annotators()
 
-    def _get_video_metadata(self):
+    def _get_video_metadata(self, video_info: VideoInfo = None):
         video: VideoSchema = self.manager.get_video(self.measurement.video_id)
         self.video_url = video.optimized_video_url
         self.video_duration = video.duration
-        self.video_info = VideoInfo.from_video_path(self.video_url)
+        # video_info is given when frames come from the optimizer directly
+        self.video_info = video_info or self._get_optimized_video_info(video)
         
         status = UpdateMeasurementInternal(status='PROCESSING')
         self.measurement = self.manager.update_measurement(self.measurement.id,
                                                            status)
+        self.progress = ProgressPublisher('measurement',
+                                          self.measurement.id,
+                                          self.video_info.total_frames)
+        self.progress.set_status(self.measurement.status)
+
+    def _get_optimized_video_info(self, video: VideoSchema):
+        stored = [video.optimized_width,
+                  video.optimized_height,
+                  video.optimized_fps]
+        if not all(stored):
+            # Videos optimized before these fields existed
+            return VideoInfo.from_video_path(self.video_url)
+        return VideoInfo(width=video.optimized_width,
+                         height=video.optimized_height,
+                         fps=video.optimized_fps,
+                         total_frames=video.optimized_total_frames)
 
     def _instantiate_annotators(self):
         self.box_annotator = self._get_box_annotator()
         self._get_line_points()
-        self.global_annotator = self._get_line_annotator()
+        self.roi = self.get_roi() if self.measurement.roi_inference else None
+        self.motion_regions = [self.get_roi()]
+        line_counter = LineCrossingCounter([self.line], self.ALLOWED_CLASS_ID)
+        self.set_line_counter(line_counter)
+
+    def set_line_counter(self,
+                         line_counter: LineCrossingCounter,
+                         line_index: int = 0,
+                         shared: bool = False):
+        # Shared counters hold several measurements' lines and are
+        # triggered once per frame by their owner
+        self.line_counter = line_counter
+        self.triggers_counter = not shared
+        self.global_annotator = (line_counter.get_view(line_index),
+                                 self._get_line_annotator())
         self.class_annotators = {
-            class_id: self._get_line_annotator()
+            class_id: (line_counter.get_view(line_index, class_id),
+                       self._get_line_annotator())
             for class_id in self.ALLOWED_CLASS_ID
         }
 
@@ -58,12 +114,10 @@ class VideoPredictor:
         return box_annotator
 
     def _get_line_annotator(self):
-        start, end = self._line_start, self._line_end
-        line_counter = sv.LineZone(start=start, end=end)
         line_annotator = sv.LineZoneAnnotator(thickness=2,
                                               text_thickness=1,
                                               text_scale=0.5)
-        return line_counter, line_annotator
+        return line_annotator
 
     def _get_line_points(self):
         x1 = int(self.video_info.width * self.measurement.x1)
@@ -73,49 +127,135 @@ class VideoPredictor:
         self._line_start = sv.Point(x1, y1)
         self._line_end = sv.Point(x2, y2)
 
-    def predict(self):
+    @property
+    def line(self):
+        return self._line_start, self._line_end
+
+    def get_roi(self):
+        frame_size = (self.video_info.width, self.video_info.height)
+        return self.get_line_roi(self.line, frame_size)
+
+    @classmethod
+    def get_line_roi(cls, line, frame_size: tuple[int, int]):
+        # Line bounding box padded by a fraction of the frame on each side
+        width, height = frame_size
+        pad_x = int(width * cls.ROI_PADDING)
+        pad_y = int(height * cls.ROI_PADDING)
+        start, end = line
+        x1 = max(min(start.x, end.x) - pad_x, 0)
+        y1 = max(min(start.y, end.y) - pad_y, 0)
+        x2 = min(max(start.x, end.x) + pad_x, width)
+        y2 = min(max(start.y, end.y) + pad_y, height)
+        return x1, y1, x2, y2
+
+    def get_motion_gate(self):
+        if not self.MOTION_GATE:
+            return None
+        frame_size = (self.video_info.width, self.video_info.height)
+        return MotionGate(self.motion_regions, frame_size)
+
+    def save_timing(self):
+        self.timer.save(self.manager,
+                        'prediction',
+                        self.measurement.video_id,
+                        self.measurement.id,
+                        frames=self.processed_frames - self.start_frame)
+
+    def get_output_paths(self):
         target_s3_key = self.manager.generate_video_key('output')
         local_filename = target_s3_key.split("/")[-1]
         # _target_path is raw mp4, target_path is the file for web codec 
         _target_path = os.path.join(os.getcwd(), f'_{local_filename}')
         target_path = os.path.join(os.getcwd(), local_filename)
+        return target_s3_key, _target_path, target_path
 
-        self.generate_predicted_video(_target_path)
-
+    def save_output(self, target_s3_key, _target_path, target_path):
         is_valid_in_filesystem = os.path.isfile(_target_path)
         if not is_valid_in_filesystem:
             raise ValueError('Target path is not a valid path')
         
         # Use ffmpeg to change codecs
-        os.system(f"ffmpeg -y -i {_target_path} -vcodec libx264 -f mp4 {target_path}")
-        self.manager.s3.upload_video_file(target_path, target_s3_key)
+        with self.timer.stage('transcode'):
+            transcode_to_h264(_target_path, target_path)
+        with self.timer.stage('upload'):
+            self.manager.s3.upload_video_file(target_path, target_s3_key)
         os.remove(target_path)
         os.remove(_target_path)
         self.save_result_statistics(target_s3_key)
 
-    def generate_predicted_video(self, target_path):
-        with VideoSink(target_path, self.video_info) as sink:
-            for result in model.track(source=self.video_url,
-            # for result in model.track(source='/app/src/core/assets/vid2_optimized.mp4',
-                                      stream=True):
-                try:
-                    frame = result.orig_img
-                    detections = self.process_frame_detections(result)
-                    labels = self.get_frame_labels(detections)
-
-                    frame = self.box_annotator.annotate(
-                        scene=frame, 
-                        detections=detections,
-                        labels=labels
-                    )
-                    self.count_and_annotate_class_detections(frame, detections)
-                    counter, annotator = self.global_annotator
-                    counter.trigger(detections=detections)
-                    annotator.annotate(frame=frame, line_counter=counter)
-                    # TODO: Update progress to queue
-                    sink.write_frame(frame)
-                except Exception:
-                    continue
+    def load_tracks(self):
+        # Loaded once, so a resumed pass never switches detection source
+        if not self.tracks_loaded and self.TRACK_STORE:
+            self.tracks = self.track_store.load(self.measurement.video_id)
+        self.tracks_loaded = True
+        return self.tracks
+
+    def iter_frame_detections(self, render: bool = True):
+        tracks = self.load_tracks()
+        if tracks is None:
+            yield from self.iter_inferred_detections()
+            return
+        stored = islice(tracks.iter_frames(), self.start_frame, None)
+        if render:
+            # Frames are still needed to draw on, inference is not
+            decoder = DecoderFactory.get_decoder(self.video_url,
+                                                 start_frame=self.start_frame)
+            with decoder:
+                frames = self.timer.time_iter('decode', decoder)
+                for (_, frame), detections in zip(frames, stored):
+                    yield frame, self.filter_detections(detections)
+        else:
+            for detections in stored:
+                yield None, self.filter_detections(detections)
+
+    def iter_inferred_detections(self):
+        # Tracks are only complete when the pass starts at the first frame
+        recorder = TrackRecorder() if not self.start_frame else None
+        self.tracker = FrameTracker(self.model,
+                                    roi=self.roi,
+                                    motion_gate=self.get_motion_gate(),
+                                    timer=self.timer)
+        if self.tracker_state:
+            self.tracker.set_state(self.tracker_state)
+        decoder = DecoderFactory.get_decoder(self.video_url,
+                                             start_frame=self.start_frame)
+        with decoder:
+            frames = self.timer.time_iter('decode', decoder)
+            for index, frame, result in self.tracker.iter_tracked(frames):
+                detections = self.get_tracked_detections(result)
+                if recorder is not None:
+                    recorder.add(index, detections)
+                yield frame, self.filter_detections(detections)
+        if self.TRACK_STORE and recorder is not None \
+                and self.tracker.is_full_inference:
+            self.track_store.save(self.measurement.video_id, recorder)
+
+    def is_tracker_synced(self, frame: int) -> bool:
+        # The tracker runs a whole batch ahead of the frames handed out
+        return self.tracker is None or \
+            self.tracker.frames == frame - self.start_frame
+
+    def count_frame_detections(self, detections: sv.Detections):
+        # Updates every class counter and the global one in a single step
+        if self.triggers_counter:
+            with self.timer.stage('count', 1):
+                self.line_counter.trigger(detections)
+
+    def annotate_frame(self, frame: np.ndarray, detections: sv.Detections):
+        with self.timer.stage('annotate', 1):
+            return self._annotate_frame(frame, detections)
+
+    def _annotate_frame(self, frame: np.ndarray, detections: sv.Detections):
+        labels = self.get_frame_labels(detections)
+        frame = self.box_annotator.annotate(
+            scene=frame, 
+            detections=detections,
+            labels=labels
+        )
+        self.count_and_annotate_class_detections(frame, detections)
+        counter, annotator = self.global_annotator
+        annotator.annotate(frame=frame, line_counter=counter)
+        return frame
         
     def save_result_statistics(self, output_s3_key):
         global_count = 0
@@ -126,12 +266,13 @@ class VideoPredictor:
             if count == 0:
                 continue
             detection = DetectionSchema(
-                class_name=model.model.names.get(k).upper(),
+                class_name=get_class_names().get(k).upper(),
                 count=count,
                 frequency=frequency
             )
-            self.manager.create_detection(self.measurement.id,
-                                          detection)
+            with self.timer.stage('database'):
+                self.manager.create_detection(self.measurement.id,
+                                              detection)
         global_frequency = global_count/self.video_duration
         measurement = UpdateMeasurementInternal(
             status='PREDICTED',
@@ -139,22 +280,43 @@ class VideoPredictor:
             detections_count=global_count,
             global_frequency=global_frequency
         )
-        self.manager.update_measurement(self.measurement.id,
-                                        measurement)
+        with self.timer.stage('database'):
+            self.measurement = self.manager.update_measurement(
+                self.measurement.id,
+                measurement)
+        self.progress.set_status(self.measurement.status, self.get_counts())
+
+    def get_counts(self):
+        return {get_class_names()[class_id].upper():
+                counter.in_count + counter.out_count
+                for class_id, (counter, _) in self.class_annotators.items()}
+
+    def update_progress(self, frame: int):
+        self.processed_frames = frame
+        if self.progress.is_due():
+            self.progress.update(frame, self.get_counts())
 
     def process_frame_detections(self, result):
+        detections = self.get_tracked_detections(result)
+        return self.filter_detections(detections)
+
+    @staticmethod
+    def get_tracked_detections(result):
         detections = sv.Detections.from_yolov8(result)
         if result.boxes.id is not None:
             detections.tracker_id = result.boxes.id.cpu().numpy().astype(int)
-        
+        return detections
+
+    @classmethod
+    def filter_detections(cls, detections: sv.Detections):
         detections = detections[(np.isin(detections.class_id,
-                                         self.ALLOWED_CLASS_ID))
-                                & (detections.confidence > self.CONFIDENCE_THRESHOLD)]
+                                         cls.ALLOWED_CLASS_ID))
+                                & (detections.confidence > cls.CONFIDENCE_THRESHOLD)]
         return detections
 
     def get_frame_labels(self, detections):
         labels = [
-            f"{model.model.names[class_id].title()} {confidence:0.2f}"
+            f"{get_class_names()[class_id].title()} {confidence:0.2f}"
             for *_, confidence, class_id, tracker_id
             in detections
         ]
@@ -163,21 +325,7 @@ class VideoPredictor:
     def count_and_annotate_class_detections(self,
                                             frame: np.ndarray,
                                             detections: sv.Detections):
-        for class_id, annotation_classes in self.class_annotators.items():
+        self.count_frame_detections(detections)
+        for annotation_classes in self.class_annotators.values():
             counter, annotator = annotation_classes
-            class_detections = self.extract_class_detections(detections,
-                                                             class_id)
-            counter.trigger(detections=class_detections)
             annotator.annotate(frame=frame, line_counter=counter)
-
-    def extract_class_detections(self,
-                                 detections: sv.Detections,
-                                 class_id: int) -> sv.Detections:
-        class_mask = (detections.class_id == class_id)
-        filtered_detections = sv.Detections(
-            xyxy=detections.xyxy[class_mask],
-            confidence=detections.confidence[class_mask],
-            class_id=detections.class_id[class_mask],
-            mask=detections.mask[class_mask] if not detections.mask is None else None,
-            tracker_id=detections.tracker_id[class_mask] if not detections.tracker_id is None else None)
-        return filtered_detections
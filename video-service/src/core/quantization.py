@@ -0,0 +1,162 @@
+'''Offline INT8 quantization of the configured model.
+
+Run from the service source directory:
+    python -m core.quantization calibrate --videos 1 2 3
+    python -m core.quantization gate --videos 4 5 6
+
+calibrate exports the fp32 ONNX model and statically quantizes it with
+frames sampled from the given optimized videos. gate counts every active
+measurement of the reference videos with the fp32 PyTorch model and the
+INT8 one, and writes the report the INT8 model needs before it loads.
+'''
+import os
+import json
+import logging
+import argparse
+import numpy as np
+import onnx
+from onnxruntime.quantization import (CalibrationDataReader,
+                                      CalibrationMethod,
+                                      QuantFormat,
+                                      QuantType,
+                                      quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+from settings import settings
+from core.model import (initialize_model,
+                        export_model,
+                        get_export_path,
+                        get_gate_report_path)
+from core.decoder import DecoderFactory
+from core.validation import CountComparison
+from shared.log_config import setup_logger
+from shared.service.videos import VideoManager
+
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+    '''Feeds frames to the calibrator preprocessed like ultralytics does
+    for exported models: letterboxed to a square, RGB, CHW, 0-1 range'''
+
+    def __init__(self, frames: list[np.ndarray], input_name: str,
+                 image_size: int = 640) -> None:
+        self.frames = iter(frames)
+        self.input_name = input_name
+        self.letterbox = LetterBox((image_size, image_size), auto=False)
+
+    def get_next(self):
+        frame = next(self.frames, None)
+        if frame is None:
+            return None
+        image = self.letterbox(image=frame)[..., ::-1].transpose(2, 0, 1)
+        image = np.ascontiguousarray(image, dtype=np.float32) / 255
+        return {self.input_name: image[None]}
+
+
+class ModelQuantizer:
+    def __init__(self, model_name: str = settings.MODEL_NAME) -> None:
+        self.model_name = model_name
+        self.manager = VideoManager('internal')
+
+    def sample_frames(self, video_ids: list[int], frame_count: int):
+        frames = []
+        per_video = max(frame_count // len(video_ids), 1)
+        for video_id in video_ids:
+            video = self.manager.get_video(video_id)
+            total_frames = video.optimized_total_frames or video.total_frames
+            step = max(total_frames // per_video, 1)
+            decoder = DecoderFactory.get_decoder(
+                video.optimized_video_url,
+                frame_filter=lambda index: index % step == 0)
+            with decoder:
+                video_frames = []
+                for _, frame in decoder:
+                    video_frames.append(frame)
+                    if len(video_frames) == per_video:
+                        break
+            frames += video_frames
+        logger.info(f'Sampled {len(frames)} calibration frames '
+                    f'from videos {video_ids}')
+        return frames
+
+    def get_head_prefix(self):
+        # Box decoding in the Detect head loses too much precision in INT8
+        layers = YOLO(self.model_name).model.model
+        return f'/model.{len(layers) - 1}/'
+
+    def get_excluded_nodes(self, model: onnx.ModelProto):
+        prefix = self.get_head_prefix()
+        return [node.name for node in model.graph.node
+                if node.name.startswith(prefix) and node.op_type != 'Conv']
+
+    def quantize(self, video_ids: list[int], frame_count: int = 300):
+        fp32_path = export_model(self.model_name, 'onnx')
+        int8_path = get_export_path(self.model_name, 'onnx', 'int8')
+        prepared_path = f'{fp32_path}.prepared.onnx'
+        quant_pre_process(fp32_path, prepared_path)
+        fp32_model = onnx.load(fp32_path)
+        input_name = fp32_model.graph.input[0].name
+        reader = FrameCalibrationReader(
+            self.sample_frames(video_ids, frame_count), input_name)
+        quantize_static(prepared_path,
+                        int8_path,
+                        reader,
+                        quant_format=QuantFormat.QDQ,
+                        per_channel=True,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        calibrate_method=CalibrationMethod.MinMax,
+                        nodes_to_exclude=self.get_excluded_nodes(fp32_model))
+        os.remove(prepared_path)
+        # Ultralytics reads class names and stride from the model metadata
+        int8_model = onnx.load(int8_path)
+        del int8_model.metadata_props[:]
+        int8_model.metadata_props.extend(fp32_model.metadata_props)
+        onnx.save(int8_model, int8_path)
+        # A new model has to pass the gate again
+        report_path = get_gate_report_path(int8_path)
+        if os.path.isfile(report_path):
+            os.remove(report_path)
+        logger.info(f'Saved INT8 model to {int8_path}')
+        return int8_path
+
+
+class CountAccuracyGate(CountComparison):
+    '''Compares counts of the INT8 model against the fp32 PyTorch model'''
+
+    def __init__(self, model_name: str = settings.MODEL_NAME) -> None:
+        super().__init__(model_name)
+        self.model_path = get_export_path(model_name, 'onnx', 'int8')
+
+    def count_reference(self, source, lines, frame_size):
+        return self.count(self.reference, source, lines)
+
+    def count_candidate(self, source, lines, frame_size):
+        return self.count(self.candidate, source, lines)
+
+    def run(self, video_ids: list[int]):
+        if not os.path.isfile(self.model_path):
+            raise FileNotFoundError(f'{self.model_path} does not exist, '
+                                    'run calibrate first')
+        self.reference = initialize_model(self.model_name)
+        self.candidate = YOLO(self.model_path, task='detect')
+        report = {'model': self.model_path, **super().run(video_ids)}
+        with open(get_gate_report_path(self.model_path), 'w') as file:
+            json.dump(report, file, indent=2)
+        return report['passed']
+
+
+if __name__ == '__main__':
+    setup_logger(logging.root)
+    parser = argparse.ArgumentParser(description='INT8 model quantization')
+    parser.add_argument('command', choices=['calibrate', 'gate'])
+    parser.add_argument('--videos', type=int, nargs='+', required=True)
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+    if args.command == 'calibrate':
+        ModelQuantizer().quantize(args.videos, args.frames)
+    else:
+        raise SystemExit(0 if CountAccuracyGate().run(args.videos) else 1)
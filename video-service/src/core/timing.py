@@ -0,0 +1,90 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+from shared.service.videos import VideoManager
+from shared.schemas.timings import TaskTimingSchema, StageTimingSchema
+
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    '''Accumulates wall time and processed frames per named stage of a
+    task. Stages may overlap (e.g. decode runs ahead in its own thread),
+    so their sum is not expected to match the total.'''
+
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.seconds = {}
+        self.frames = {}
+
+    def add(self, name: str, seconds: float, frames: int = 0):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.frames[name] = self.frames.get(name, 0) + frames
+
+    @contextmanager
+    def stage(self, name: str, frames: int = 0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, frames)
+
+    def time_iter(self, name: str, iterable: Iterable) -> Iterator:
+        # Time spent waiting for each item, one frame per item
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start, 1)
+            yield item
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self.started_at
+
+    def get_stages(self):
+        stages = {}
+        for name, seconds in self.seconds.items():
+            frames = self.frames[name]
+            fps = round(frames / seconds, 1) if frames and seconds else None
+            stages[name] = StageTimingSchema(seconds=round(seconds, 4),
+                                             frames=frames,
+                                             fps=fps)
+        return stages
+
+    def get_timing(self, task_type: str, video_id: int,
+                   measurement_id: int = None, frames: int = 0):
+        total_seconds = self.total_seconds
+        fps = round(frames / total_seconds, 1) if frames else None
+        return TaskTimingSchema(task_type=task_type,
+                                video_id=video_id,
+                                measurement_id=measurement_id,
+                                total_seconds=round(total_seconds, 4),
+                                frames=frames,
+                                fps=fps,
+                                stages=self.get_stages())
+
+    def save(self, manager: VideoManager, task_type: str, video_id: int,
+             measurement_id: int = None, frames: int = 0):
+        timing = self.get_timing(task_type, video_id, measurement_id, frames)
+        stages = ' | '.join(
+            f'{name} {stage.seconds:.2f}s'
+            + (f' ({stage.fps} fps)' if stage.fps else '')
+            for name, stage in timing.stages.items())
+        task = f'measurement {measurement_id}' if measurement_id \
+            else f'video {video_id}'
+        fps = f' ({timing.fps} fps)' if timing.fps else ''
+        logger.info(f'{task_type.title()} of {task}: '
+                    f'{timing.total_seconds:.2f}s, {frames} frames{fps} '
+                    f'| {stages}')
+        try:
+            manager.create_task_timing(timing)
+        except Exception as e:
+            # Timings are diagnostics and never fail a task
+            logger.warning(f'Task timing could not be saved: {e}')
@@ -0,0 +1,151 @@
+import time
+import pickle
+import logging
+from typing import Iterable, Iterator
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+from ultralytics.trackers import BOTSORT, BYTETracker
+from ultralytics.trackers.basetrack import BaseTrack
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+from settings import settings
+from core.motion import MotionGate
+from core.timing import StageTimer
+
+
+logger = logging.getLogger(__name__)
+
+
+class FrameTracker:
+    '''Runs detection on batches of frames and feeds each result to the
+    tracker in frame order. Mirrors the tracking callbacks Model.track
+    registers, with one tracker for the whole video instead of one per
+    batch slot.'''
+
+    TRACKER_MAP = {'bytetrack': BYTETracker, 'botsort': BOTSORT}
+    # Model.track defaults
+    TRACKER_CONFIG = 'botsort.yaml'
+    CONFIDENCE = 0.1
+
+    def __init__(self,
+                 model,
+                 batch_size: int = settings.INFERENCE_BATCH_SIZE,
+                 roi: tuple[int, int, int, int] = None,
+                 motion_gate: MotionGate = None,
+                 timer: StageTimer = None):
+        self.model = model
+        self.batch_size = max(batch_size, 1)
+        # Detection runs on the (x1, y1, x2, y2) crop, boxes are tracked
+        # and returned in full frame coordinates
+        self.roi = roi
+        # Frames the gate skips reuse the last result and leave the tracker
+        # untouched, so its state carries across the gap
+        self.motion_gate = motion_gate
+        self.last_result = None
+        self.timer = timer or StageTimer()
+        config = IterableSimpleNamespace(
+            **yaml_load(check_yaml(self.TRACKER_CONFIG)))
+        tracker_class = self.TRACKER_MAP[config.tracker_type]
+        self.tracker = tracker_class(args=config, frame_rate=30)
+        self.frames = 0
+        self.seconds = 0.0
+
+    def iter_tracked(self,
+                     frames: Iterable[tuple[int, np.ndarray]]
+                     ) -> Iterator[tuple[int, np.ndarray, Results]]:
+        batch = []
+        inferred = 0
+        for index, frame in frames:
+            infer = self.motion_gate is None or \
+                self.needs_inference(frame)
+            batch.append((index, frame, infer))
+            inferred += infer
+            # Batches are filled with frames that go through the model
+            if inferred == self.batch_size:
+                yield from self.track_batch(batch)
+                batch = []
+                inferred = 0
+        if batch:
+            yield from self.track_batch(batch)
+        self.log_throughput()
+        if self.motion_gate:
+            self.motion_gate.log_skipped()
+
+    def needs_inference(self, frame: np.ndarray) -> bool:
+        with self.timer.stage('motion_gate', 1):
+            return self.motion_gate.needs_inference(frame)
+
+    @property
+    def is_full_inference(self):
+        # Only results of every full frame can be reused by any measurement
+        return self.roi is None and self.motion_gate is None
+
+    def track_batch(self, batch: list[tuple[int, np.ndarray, bool]]):
+        start = time.perf_counter()
+        frames = [frame for _, frame, infer in batch if infer]
+        images = [self.crop(frame) for frame in frames]
+        results = []
+        if images:
+            with self.timer.stage('inference', len(images)):
+                results = self.model.predict(source=images,
+                                             conf=self.CONFIDENCE,
+                                             verbose=False)
+        with self.timer.stage('tracking', len(images)):
+            results = iter([self.update(self.offset(result, frame))
+                            for result, frame in zip(results, frames)])
+        self.seconds += time.perf_counter() - start
+        self.frames += len(batch)
+        for index, frame, infer in batch:
+            if infer:
+                self.last_result = next(results)
+            yield index, frame, self.last_result
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        if self.roi is None:
+            return frame
+        x1, y1, x2, y2 = self.roi
+        return frame[y1:y2, x1:x2]
+
+    def offset(self, result: Results, frame: np.ndarray) -> Results:
+        if self.roi is None:
+            return result
+        # Results.update clips boxes to orig_shape, so the result covers the
+        # full frame before the boxes are moved. The tracker also gets the
+        # full frame for its motion compensation.
+        result.orig_img = frame
+        result.orig_shape = frame.shape[:2]
+        boxes = result.boxes.data.clone()
+        boxes[:, [0, 2]] += self.roi[0]
+        boxes[:, [1, 3]] += self.roi[1]
+        result.update(boxes=boxes)
+        return result
+
+    def update(self, result: Results) -> Results:
+        detections = result.boxes.cpu().numpy()
+        if len(detections) == 0:
+            return result
+        tracks = self.tracker.update(detections, result.orig_img)
+        if len(tracks) == 0:
+            return result
+        index = tracks[:, -1].astype(int)
+        result = result[index]
+        result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return result
+
+    def get_state(self) -> dict:
+        # Track ids come from a process-wide counter, saved along the tracker
+        return {'tracker': pickle.dumps(self.tracker),
+                'track_count': BaseTrack._count}
+
+    def set_state(self, state: dict):
+        self.tracker = pickle.loads(state['tracker'])
+        BaseTrack._count = max(BaseTrack._count, state['track_count'])
+
+    def log_throughput(self):
+        if not self.seconds:
+            return
+        fps = self.frames / self.seconds
+        roi = f', roi {self.roi}' if self.roi else ''
+        logger.info(f'Tracked {self.frames} frames at {fps:.1f} fps '
+                    f'(batch size {self.batch_size}{roi})')
@@ -0,0 +1,128 @@
+import os
+import logging
+import numpy as np
+import supervision as sv
+from settings import settings
+from core.model import get_model_key
+from shared.aws.s3 import S3Service
+
+
+logger = logging.getLogger(__name__)
+
+
+class TrackRecorder:
+    '''Accumulates per-frame tracked detections in columnar form'''
+
+    def __init__(self) -> None:
+        self.frame_count = 0
+        self.frame_index = []
+        self.xyxy = []
+        self.class_id = []
+        self.confidence = []
+        self.tracker_id = []
+
+    def add(self, frame_index: int, detections: sv.Detections):
+        self.frame_count = max(self.frame_count, frame_index + 1)
+        size = len(detections)
+        if size == 0:
+            return
+        tracker_id = detections.tracker_id
+        if tracker_id is None:
+            tracker_id = np.full(size, -1)
+        self.frame_index.append(np.full(size, frame_index, dtype=np.int32))
+        self.xyxy.append(detections.xyxy.astype(np.float32))
+        self.class_id.append(detections.class_id.astype(np.int16))
+        self.confidence.append(detections.confidence.astype(np.float32))
+        self.tracker_id.append(tracker_id.astype(np.int32))
+
+    def to_tracks(self):
+        def concat(arrays, dtype, shape=(0,)):
+            if not arrays:
+                return np.zeros(shape, dtype=dtype)
+            return np.concatenate(arrays)
+
+        return VideoTracks(frame_count=self.frame_count,
+                           frame_index=concat(self.frame_index, np.int32),
+                           xyxy=concat(self.xyxy, np.float32, (0, 4)),
+                           class_id=concat(self.class_id, np.int16),
+                           confidence=concat(self.confidence, np.float32),
+                           tracker_id=concat(self.tracker_id, np.int32))
+
+
+class VideoTracks:
+    '''Tracked detections of a whole video. Rows are sorted by frame and a
+    tracker_id of -1 marks detections the tracker did not confirm.'''
+
+    COLUMNS = ['frame_index', 'xyxy', 'class_id', 'confidence', 'tracker_id']
+
+    def __init__(self,
+                 frame_count: int,
+                 frame_index: np.ndarray,
+                 xyxy: np.ndarray,
+                 class_id: np.ndarray,
+                 confidence: np.ndarray,
+                 tracker_id: np.ndarray) -> None:
+        self.frame_count = frame_count
+        self.frame_index = frame_index
+        self.xyxy = xyxy
+        self.class_id = class_id
+        self.confidence = confidence
+        self.tracker_id = tracker_id
+
+    @classmethod
+    def from_file(cls, path: str):
+        with np.load(path) as data:
+            columns = {column: data[column] for column in cls.COLUMNS}
+            return cls(frame_count=int(data['frame_count']), **columns)
+
+    def to_file(self, path: str):
+        columns = {column: getattr(self, column) for column in self.COLUMNS}
+        with open(path, 'wb') as file:
+            np.savez_compressed(file,
+                                frame_count=np.array(self.frame_count),
+                                **columns)
+
+    def iter_frames(self):
+        frames = np.arange(self.frame_count + 1)
+        bounds = np.searchsorted(self.frame_index, frames)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            tracker_id = self.tracker_id[start:end]
+            if len(tracker_id) == 0 or (tracker_id < 0).any():
+                tracker_id = None
+            yield sv.Detections(xyxy=self.xyxy[start:end],
+                                confidence=self.confidence[start:end],
+                                class_id=self.class_id[start:end].astype(int),
+                                tracker_id=tracker_id)
+
+
+class TrackStore:
+    CACHE_DIR = settings.TRACKS_CACHE_DIR
+
+    def __init__(self, s3: S3Service) -> None:
+        self.s3 = s3
+        os.makedirs(self.CACHE_DIR, exist_ok=True)
+
+    def get_key(self, video_id: int):
+        return f'tracks/{video_id}/{get_model_key()}.npz'
+
+    def get_cache_path(self, video_id: int):
+        return os.path.join(self.CACHE_DIR, self.get_key(video_id)
+                            .replace('/', '_'))
+
+    def load(self, video_id: int) -> VideoTracks | None:
+        path = self.get_cache_path(video_id)
+        if not os.path.isfile(path):
+            key = self.get_key(video_id)
+            if not self.s3.file_exists(key):
+                return None
+            self.s3.download_file(key, path)
+        logger.info(f'Reusing stored tracks for video {video_id}')
+        return VideoTracks.from_file(path)
+
+    def save(self, video_id: int, recorder: TrackRecorder):
+        self.save_tracks(video_id, recorder.to_tracks())
+
+    def save_tracks(self, video_id: int, tracks: VideoTracks):
+        path = self.get_cache_path(video_id)
+        tracks.to_file(path)
+        self.s3.upload_file(path, self.get_key(video_id))
@@ -0,0 +1,141 @@
+'''Offline count validation against the full inference path.
+
+Run from the service source directory:
+    python -m core.validation motion --videos 1 2 3
+'''
+import logging
+import argparse
+from abc import ABC, abstractmethod
+import supervision as sv
+from supervision.utils.video import VideoInfo
+from settings import settings
+from core.model import initialize_model
+from core.counter import LineCrossingCounter
+from core.decoder import DecoderFactory
+from core.motion import MotionGate
+from core.tracking import FrameTracker
+from core.predictor import VideoPredictor
+from shared.log_config import setup_logger
+from shared.service.videos import VideoManager
+
+
+logger = logging.getLogger(__name__)
+
+
+class CountComparison(ABC):
+    '''Counts every active measurement of a set of videos with a reference
+    and a candidate setup and compares per-class crossing counts. A class
+    count passes when it is within TOLERANCE of the reference count,
+    rounded down, so small counts must match exactly.'''
+
+    TOLERANCE = settings.COUNT_VALIDATION_TOLERANCE
+
+    def __init__(self, model_name: str = settings.MODEL_NAME) -> None:
+        self.model_name = model_name
+        self.manager = VideoManager('internal')
+
+    def get_frame_size(self, video):
+        width, height = video.optimized_width, video.optimized_height
+        if not (width and height):
+            video_info = VideoInfo.from_video_path(video.optimized_video_url)
+            width, height = video_info.width, video_info.height
+        return width, height
+
+    def get_lines(self, frame_size, measurements):
+        width, height = frame_size
+        return [(sv.Point(int(width * m.x1), int(height * m.y1)),
+                 sv.Point(int(width * m.x2), int(height * m.y2)))
+                for m in measurements]
+
+    def count(self, model, source: str, lines,
+              motion_gate: MotionGate = None) -> LineCrossingCounter:
+        line_counter = LineCrossingCounter(lines, settings.ALLOWED_CLASS_ID)
+        tracker = FrameTracker(model, motion_gate=motion_gate)
+        with DecoderFactory.get_decoder(source) as decoder:
+            for _, _, result in tracker.iter_tracked(decoder):
+                detections = VideoPredictor.get_tracked_detections(result)
+                line_counter.trigger(
+                    VideoPredictor.filter_detections(detections))
+        return line_counter
+
+    @abstractmethod
+    def count_reference(self, source, lines, frame_size):
+        pass
+
+    @abstractmethod
+    def count_candidate(self, source, lines, frame_size):
+        pass
+
+    def compare(self, video_id, measurements, reference, candidate):
+        rows = []
+        for line_index, measurement in enumerate(measurements):
+            for class_id in settings.ALLOWED_CLASS_ID:
+                expected = reference.get_view(line_index, class_id)
+                actual = candidate.get_view(line_index, class_id)
+                expected = expected.in_count + expected.out_count
+                actual = actual.in_count + actual.out_count
+                allowed = int(self.TOLERANCE * expected)
+                rows.append({'video_id': video_id,
+                             'measurement_id': measurement.id,
+                             'class_id': class_id,
+                             'reference_count': expected,
+                             'candidate_count': actual,
+                             'passed': abs(actual - expected) <= allowed})
+        return rows
+
+    def run(self, video_ids: list[int]) -> dict:
+        rows = []
+        for video_id in video_ids:
+            video = self.manager.get_video(video_id)
+            measurements = [m for m in video.measurements if m.is_active]
+            if not measurements:
+                logger.warning(f'Video {video_id} has no measurements')
+                continue
+            frame_size = self.get_frame_size(video)
+            lines = self.get_lines(frame_size, measurements)
+            source = video.optimized_video_url
+            rows += self.compare(
+                video_id,
+                measurements,
+                self.count_reference(source, lines, frame_size),
+                self.count_candidate(source, lines, frame_size))
+        passed = bool(rows) and all(row['passed'] for row in rows)
+        for row in rows:
+            if not row['passed']:
+                logger.warning(f'Count drift: {row}')
+        logger.info(f'{self.__class__.__name__} '
+                    f'{"passed" if passed else "failed"} '
+                    f'on {len(rows)} class counts')
+        return {'tolerance': self.TOLERANCE,
+                'video_ids': video_ids,
+                'passed': passed,
+                'counts': rows}
+
+
+class MotionGateValidation(CountComparison):
+    '''Compares counts with the motion gate against full inference'''
+
+    def __init__(self, model_name: str = settings.MODEL_NAME) -> None:
+        super().__init__(model_name)
+        self.model = initialize_model(model_name,
+                                      settings.INFERENCE_BACKEND,
+                                      settings.INFERENCE_PRECISION)
+
+    def count_reference(self, source, lines, frame_size):
+        return self.count(self.model, source, lines)
+
+    def count_candidate(self, source, lines, frame_size):
+        regions = [VideoPredictor.get_line_roi(line, frame_size)
+                   for line in lines]
+        motion_gate = MotionGate(regions, frame_size)
+        return self.count(self.model, source, lines, motion_gate)
+
+
+if __name__ == '__main__':
+    setup_logger(logging.root)
+    parser = argparse.ArgumentParser(description='Count validation')
+    parser.add_argument('command', choices=['motion'])
+    parser.add_argument('--videos', type=int, nargs='+', required=True)
+    args = parser.parse_args()
+    report = MotionGateValidation().run(args.videos)
+    raise SystemExit(0 if report['passed'] else 1)
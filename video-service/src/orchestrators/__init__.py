@@ -1,2 +1,3 @@
 from .optimizer_orchestrator import OptimizerOrchestrator
 from .predictor_orchestrator import PredictorOrchestrator
+from .clip_orchestrator import ClipOrchestrator
@@ -0,0 +1,28 @@
+import logging
+from orchestrators.generic_orchestrator import GenericOrchestrator
+from core.clips import ClipRenderer
+
+
+logger = logging.getLogger(__name__)
+
+
+class ClipOrchestrator(GenericOrchestrator):
+    QUEUE_NAME = 'CLIPS'
+    TASK_TYPE = 'clip'
+
+    def __init__(self) -> None:
+        super().__init__()
+
+    def process_task(self):
+        clip_id = self.get_next_task()
+        if not clip_id:
+            logger.debug("No clips in queue. Awaiting clips.")
+            return
+        try:
+            logger.info(f"Rendering clip ID {clip_id}")
+            renderer = ClipRenderer(clip_id)
+            renderer.render()
+            self.remove_complete_task(clip_id)
+        except Exception as e:
+            logger.warning(e)
+            self.send_task_to_error(clip_id, 'clip')
@@ -1,40 +1,78 @@
+import logging
 from abc import ABC, abstractmethod
+from settings import settings
 from shared.schemas.videos import UpdateVideoAPI
 from shared.schemas.measurements import UpdateMeasurementAPI
+from shared.schemas.clips import UpdateClip
 from shared.service.videos import VideoManager
-from shared.queue.queue import q
+from shared.queue.reliable import ReliableQueue
+from shared.queue.progress import publish_status
+
+
+logger = logging.getLogger(__name__)
 
 
 class GenericOrchestrator(ABC):
-    ORIGIN_QUEUE: str
-    WIP_QUEUE: str
-    ERROR_QUEUE: str
+    QUEUE_NAME: str
+    TASK_TYPE: str
+    REAP_INTERVAL = settings.QUEUE_REAP_INTERVAL
 
     def __init__(self) -> None:
         self.manager = VideoManager()
+        # Every orchestrator instance is a worker with its own WIP list
+        self.queue = ReliableQueue(self.QUEUE_NAME)
         self.run_service()
 
+    def recover_tasks(self):
+        # Tasks of workers whose heartbeat lapsed go back to the front of
+        # the queue, predictions resume from their last checkpoint
+        for task in self.queue.reap(self.REAP_INTERVAL):
+            self.recover_task(task)
+
+    def recover_task(self, task: int):
+        logger.info(f'Recovering {self.TASK_TYPE} {task}')
+        self.set_status(task, self.TASK_TYPE, 'QUEUED')
+
     def get_next_task(self):
-        task = q.rpoplpush(self.ORIGIN_QUEUE, self.WIP_QUEUE)
-        if task:
-            return int(task)
-    
-    def remove_complete_task(self):
-        q.lpop(self.WIP_QUEUE)
+        # Blocks until a task is available or the block timeout is reached
+        return self.queue.pop()
+
+    def claim_task(self, task: int) -> bool:
+        return self.queue.claim(task)
+
+    def remove_complete_task(self, task: int):
+        self.queue.ack(task)
+
+    def remove_complete_tasks(self, tasks: list[int]):
+        for task in tasks:
+            self.queue.ack(task)
     
-    def send_task_to_error(self, task_type: str):
-        instance_id = int(q.rpoplpush(self.WIP_QUEUE, self.ERROR_QUEUE))
+    def send_task_to_error(self, task: int, task_type: str):
+        self.queue.fail(task)
+        self.set_error_status(task, task_type)
+
+    def send_tasks_to_error(self, tasks: list[int], task_type: str):
+        for task in tasks:
+            self.send_task_to_error(task, task_type)
+
+    def set_error_status(self, instance_id: int, task_type: str):
+        self.set_status(instance_id, task_type, 'ERROR')
+
+    def set_status(self, instance_id: int, task_type: str, status: str):
         task_types = {
             'video': (UpdateVideoAPI, self.manager.update_video),
-            'measurement': (UpdateMeasurementAPI, self.manager.update_measurement)
+            'measurement': (UpdateMeasurementAPI, self.manager.update_measurement),
+            'clip': (UpdateClip, self.manager.update_clip)
         }
         schema, func = task_types.get(task_type, None)
         if schema:
-            params = schema(status='ERROR')
+            params = schema(status=status)
             func(instance_id, params)
+            publish_status(task_type, instance_id, status)
 
     def run_service(self):
         while True:
+            self.recover_tasks()
             self.process_task()
 
     @abstractmethod
@@ -1,38 +1,71 @@
-import time
 import logging
 from settings import settings
-from shared.queue.queue import q
+from shared.queue.reliable import ReliableQueue
+from shared.queue.cost import TaskCost
+from shared.queue.progress import publish_status
 from shared.schemas.measurements import UpdateMeasurementAPI
 from orchestrators.generic_orchestrator import GenericOrchestrator
 from core.optimizer import VideoOptimizer
+from core.fused import FusedVideoProcessor
 
 
 logger = logging.getLogger(__name__)
 
 
 class OptimizerOrchestrator(GenericOrchestrator):
-    ORIGIN_QUEUE = 'VIDEO_TODO'
-    WIP_QUEUE = 'VIDEO_WIP'
-    ERROR_QUEUE = 'VIDEO_ERROR'
+    QUEUE_NAME = 'VIDEO'
+    TASK_TYPE = 'video'
 
     def __init__(self) -> None:
+        self.measurements_queue = ReliableQueue('MEASUREMENTS')
+        self.task_cost = TaskCost()
         super().__init__()
 
     def process_task(self):
         video_id = self.get_next_task()
         if not video_id:
-            logger.info("No videos in queue. Awaiting videos.")
-            time.sleep(settings.THREAD_ORCHESTRATOR_SLEEP_TIME)
+            logger.debug("No videos in queue. Awaiting videos.")
             return
+        requested = []
         try:
-            logger.info(f"Optimizing video ID {video_id}")
-            optimizer = VideoOptimizer(video_id)
-            optimizer.optimize()
-            self.remove_complete_task()
+            requested = self.get_requested_measurements(video_id)
+            if settings.FUSED_PIPELINE and requested:
+                logger.info(f"Optimizing video ID {video_id} and predicting "
+                            f"measurements {requested}")
+                processor = FusedVideoProcessor(video_id, requested)
+                processor.process()
+            else:
+                logger.info(f"Optimizing video ID {video_id}")
+                optimizer = VideoOptimizer(video_id)
+                optimizer.optimize()
+            self.remove_complete_task(video_id)
+            # Measurements requested while the video was being processed
             self.enqueue_measurment_tasks(video_id)
         except Exception as e:
             logger.warning(e)
-            self.send_task_to_error('video')
+            self.send_task_to_error(video_id, 'video')
+            if settings.FUSED_PIPELINE:
+                self.set_measurements_error(requested)
+
+    def recover_task(self, task: int):
+        super().recover_task(task)
+        # Measurements the fused pass had started are requested again
+        video = self.manager.get_video(task)
+        for measurement in video.measurements or []:
+            if measurement.status == 'PROCESSING':
+                params = UpdateMeasurementAPI(status='REQUESTED')
+                self.manager.update_measurement(measurement.id, params)
+
+    def get_requested_measurements(self, video_id: int):
+        video = self.manager.get_video(video_id)
+        return [measurement.id for measurement in video.measurements or []
+                if measurement.status == 'REQUESTED']
+
+    def set_measurements_error(self, measurement_ids: list[int]):
+        params = UpdateMeasurementAPI(status='ERROR')
+        for measurement_id in measurement_ids:
+            self.manager.update_measurement(measurement_id, params)
+            publish_status('measurement', measurement_id, 'ERROR')
 
     def enqueue_measurment_tasks(self, video_id: int):
         video = self.manager.get_video(video_id)
@@ -42,4 +75,7 @@ class OptimizerOrchestrator(GenericOrchestrator):
                     params = UpdateMeasurementAPI(status='QUEUED')
                     self.manager.update_measurement(measurement.id,
                                                     params)
-                    q.lpush('MEASUREMENTS_TODO', measurement.id)
+                    delay = self.task_cost.get_measurement_delay(
+                        measurement, video)
+                    self.measurements_queue.push(measurement.id, delay)
+                    publish_status('measurement', measurement.id, 'QUEUED')
@@ -1,18 +1,14 @@
-import time
 import logging
-from settings import settings
-from shared.queue.queue import q
 from orchestrators.generic_orchestrator import GenericOrchestrator
-from core.predictor import VideoPredictor
+from core.batch import BatchVideoPredictor
 
 
 logger = logging.getLogger(__name__)
 
 
 class PredictorOrchestrator(GenericOrchestrator):
-    ORIGIN_QUEUE = 'MEASUREMENTS_TODO'
-    WIP_QUEUE = 'MEASUREMENTS_WIP'
-    ERROR_QUEUE = 'MEASUREMENTS_ERROR'
+    QUEUE_NAME = 'MEASUREMENTS'
+    TASK_TYPE = 'measurement'
 
     def __init__(self) -> None:
         super().__init__()
@@ -20,14 +16,27 @@ class PredictorOrchestrator(GenericOrchestrator):
     def process_task(self):
         measurement_id = self.get_next_task()
         if not measurement_id:
-            logger.info("No measurements in queue. Awaiting measurements.")
-            time.sleep(settings.THREAD_ORCHESTRATOR_SLEEP_TIME)
+            logger.debug("No measurements in queue. Awaiting measurements.")
             return
+        measurement_ids = [measurement_id]
         try:
-            logger.info(f"Predicting measurement ID {measurement_id}")
-            predictor = VideoPredictor(measurement_id)
+            measurement_ids += self.claim_video_measurements(measurement_id)
+            logger.info(f"Predicting measurement IDs {measurement_ids}")
+            predictor = BatchVideoPredictor(measurement_ids)
             predictor.predict()
-            self.remove_complete_task()
+            self.remove_complete_tasks(measurement_ids)
         except Exception as e:
             logger.warning(e)
-            self.send_task_to_error('measurement')
+            self.send_tasks_to_error(measurement_ids, 'measurement')
+
+    def claim_video_measurements(self, measurement_id: int):
+        # Other queued measurements of the same video share the inference
+        measurement = self.manager.get_measurement(measurement_id)
+        video = self.manager.get_video(measurement.video_id)
+        claimed = []
+        for other in video.measurements or []:
+            if other.id == measurement_id or other.status != 'QUEUED':
+                continue
+            if self.claim_task(other.id):
+                claimed.append(other.id)
+        return claimed
@@ -1,7 +1,12 @@
 import threading
 import logging
-from core.checks import get_ultralytics_checks
-from orchestrators import OptimizerOrchestrator, PredictorOrchestrator
+from settings import settings
+from core.checks import (get_ultralytics_checks,
+                         check_inference_backend,
+                         check_roi_offset)
+from orchestrators import (OptimizerOrchestrator,
+                           PredictorOrchestrator,
+                           ClipOrchestrator)
 from shared.database.db import db
 from shared.queue.queue import q
 
@@ -14,12 +19,19 @@ def run_video_service(logger: logging.Logger):
     logger.info('Postgres database connected')
     logger.info('Redis queue connected')
     get_ultralytics_checks()
+    check_inference_backend()
+    check_roi_offset()
 
-    optimization_thread = threading.Thread(target=OptimizerOrchestrator)
-    prediction_thread = threading.Thread(target=PredictorOrchestrator)
+    roles = [(OptimizerOrchestrator, settings.OPTIMIZER_WORKERS),
+             (PredictorOrchestrator, settings.PREDICTOR_WORKERS),
+             (ClipOrchestrator, settings.CLIP_WORKERS)]
+    threads = [threading.Thread(target=orchestrator,
+                                name=f'{orchestrator.__name__}-{index}')
+               for orchestrator, workers in roles
+               for index in range(workers)]
 
-    optimization_thread.start()
-    prediction_thread.start()
+    for thread in threads:
+        thread.start()
 
-    optimization_thread.join()
-    prediction_thread.join()
+    for thread in threads:
+        thread.join()
@@ -7,7 +7,35 @@ class Settings(SharedSettings):
     MAX_BASE_DIMENSION: int = 360
     ALLOWED_CLASS_ID: list = [1, 2, 3, 5, 7]
     CONFIDENCE_THRESHOLD: float = 0
-    THREAD_ORCHESTRATOR_SLEEP_TIME: int = 0
+    OPTIMIZER_ENGINE: str = 'ffmpeg'
+    FFMPEG_PRESET: str = 'medium'
+    DECODER_BACKEND: str = 'opencv'
+    DECODER_READ_AHEAD: int = 64
+    DECODER_THREADS: int = 0
+    OPTIMIZER_SEGMENTS: int = 1
+    OPTIMIZER_MIN_SEGMENT_DURATION: int = 60
+    FUSED_PIPELINE: bool = True
+    TRACK_STORE: bool = True
+    TRACKS_CACHE_DIR: str = '/tmp/tracks'
+    INFERENCE_BATCH_SIZE: int = 8
+    INFERENCE_BACKEND: str = 'torch'
+    MODEL_EXPORT_DIR: str = '/tmp/models'
+    INFERENCE_PARITY_CHECK: bool = True
+    INFERENCE_PRECISION: str = 'fp32'
+    COUNT_VALIDATION_TOLERANCE: float = 0.05
+    ROI_PADDING: float = 0.15
+    MOTION_GATE: bool = False
+    MOTION_GATE_WIDTH: int = 160
+    MOTION_GATE_THRESHOLD: float = 0.01
+    MOTION_GATE_MAX_SKIP: int = 15
+    CHECKPOINT_INTERVAL: int = 300
+    PREDICTION_CHUNKS: int = 1
+    PREDICTION_MIN_CHUNK_DURATION: int = 120
+    PREDICTION_CHUNK_OVERLAP: float = 2.0
+    CLIP_WARMUP: float = 3.0
+    OPTIMIZER_WORKERS: int = 1
+    PREDICTOR_WORKERS: int = 1
+    CLIP_WORKERS: int = 1
 
 
 settings = Settings() 